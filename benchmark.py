@@ -0,0 +1,625 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import os
+import sys
+import argparse
+import hmac
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from datetime import datetime
+from hashlib import sha1
+from urllib.parse import quote, unquote
+from bs4.element import Tag, NavigableString, Comment
+from contentTransform import reworkContent, media_placeholder
+from corpus import loadPosts, streamPosts
+from collectBlog import entry_rules, comment_rules, joinContent, postProcessBody
+from httpCache import HttpCache
+from oauth import OAuth10a
+import inlineStyle
+from pageParser import parsers, parseArchivePage, parseEntryPage
+from postIndex import PostIndex
+from storage import formats, openStore
+
+def measure(fn, *args):
+    """Return result, elapsed time and peak traced memory of a single call."""
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def loadCachedPages(directory):
+    
+    cache = HttpCache(directory, offline=True)
+    pages = {'archive': [], 'entry': []}
+    for url, meta in cache.entries():
+        if (re.search(r'/archives/P\d+\.html$', url)):
+            pages['archive'].append(cache.load(url, meta))
+        elif (re.search(r'/archives/\d+-', url)):
+            pages['entry'].append(cache.load(url, meta))
+    return pages
+
+def extractArchive(soup):
+    return str(soup.find('td', id='content'))
+
+def extractEntry(soup):
+    return ''.join(str(e) for e in soup('div', class_='serendipity_entry')[:1] + soup('div', class_='serendipity_section_comments')[:1])
+
+# pages of s9y XHTML templates start with an XML declaration, which all backends must handle
+xhtml_head = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="de" lang="de">\n'
+    '<head><meta http-equiv="Content-Type" content="text/html; charset=utf-8" /><title>Blog</title></head>\n'
+    )
+xhtml_pages = {
+    'archive': [(
+        xhtml_head +
+        '<body><table id="mainpane"><tr><td id="content" valign="top">'
+        '<div class="serendipity_Entry_Date"><h3 class="serendipity_date">Montag, 14. Oktober 2019</h3>'
+        '<h4 class="serendipity_title"><a href="/index.php?/archives/397-Straße.html">Straße</a></h4>'
+        '<div class="serendipity_entry"><div class="serendipity_entry_body"><p>Häuser<br />ipsum</p></div></div></div>'
+        '</td></tr></table></body></html>'
+        ).encode('utf-8')],
+    'entry': [(
+        xhtml_head +
+        '<body><div class="serendipity_entry serendipity_entry_author_anna"><div class="serendipity_entry_body"><p>Häuser</p></div>'
+        '<div class="serendipity_entry_extended"><a id="extended"></a><p>Straße</p></div></div>'
+        '<div class="serendipity_section_comments"><div class="serendipity_comment"><div class="serendipity_commentBody">lorem</div></div></div>'
+        '</body></html>'
+        ).encode('utf-8')],
+}
+
+def bench_parse(args):
+    
+    pages = loadCachedPages(args.cache)
+    for kind, data in xhtml_pages.items():
+        pages[kind] += data
+    kinds = [
+        ('archive', parseArchivePage, extractArchive),
+        ('entry', parseEntryPage, extractEntry),
+    ]
+    
+    print('{0:8s} {1:10s} {2:>6s} {3:>12s} {4:>12s} {5:>10s}'.format('pages', 'backend', 'count', 'ms/page', 'peak KiB', 'identical'))
+    for kind, parse, extract in kinds:
+        data = pages[kind]
+        if (not data):
+            continue
+        reference = [extract(parse(d, 'full')) for d in data]
+        for backend in sorted(parsers):
+            elapsed = 0.0
+            peak = 0
+            identical = True
+            for _ in range(args.repeat):
+                for ix, d in enumerate(data):
+                    soup, t, p = measure(parse, d, backend)
+                    elapsed += t
+                    peak = max(peak, p)
+                    identical = identical and (extract(soup) == reference[ix])
+                    del soup
+            print('{0:8s} {1:10s} {2:6d} {3:12.3f} {4:12.1f} {5:>10s}'.format(
+                kind,
+                backend,
+                len(data),
+                1000 * elapsed / (len(data) * args.repeat),
+                peak / 1024,
+                'yes' if identical else 'NO'
+                ))
+    
+    return 0
+
+def postProcessBodyRecursive(soup, body, exclude, strip_attr, unwrap, placeholders=False, offset=0):
+    """Previous recursive implementation of postProcessBody as reference, offset is the number of media found before body."""
+    
+    result = copy(body)
+    result.clear()
+    media = []
+    
+    for c in body.children:
+        if (type(c) == NavigableString):
+            result.append(NavigableString(c.string.strip('\r\n')))
+        elif (type(c) == Tag):
+            if (c.name in exclude and c.has_attr('class')):
+                if (any(x in c['class'] for x in exclude[c.name])):
+                    continue
+            if (c.name == 'a' and c.has_attr('class') and 'serendipity_image_link' in c['class']):
+                img = c('img', class_=lambda x: x.startswith('serendipity_image'))[0]
+                s9ymdb_ix = -1
+                prev = img.previous_sibling
+                if (type(prev) == Comment):
+                    comment = prev.string.strip()
+                    if (comment.startswith('s9ymdb:')):
+                        s9ymdb_ix = int(comment[7:])
+                if (placeholders):
+                    result.append(Comment(media_placeholder.format(offset + len(media))))
+                media.append({'url': c['href'], 's9ymdb_index': s9ymdb_ix, 'filename': os.path.basename(c['href'])})
+                continue
+            d, dm = postProcessBodyRecursive(soup, c, exclude, strip_attr, unwrap, placeholders, offset + len(media))
+            media += dm
+            if (c.name == 'span' and 'style' in c.attrs):
+                style = c.attrs['style']
+                style = re.sub(' +:', ':', style)
+                style = re.sub(' +;', ';', style)
+                style = ''.join(style.split())
+                style = style.split(';')
+                if ('font-weight:bold' in style):
+                    b_tag = soup.new_tag('b')
+                    b_tag.append(d)
+                    result.append(b_tag)
+                else:
+                    result.append(d)
+            else:
+                result.append(d)
+            if (c.name in strip_attr):
+                for attr in strip_attr[c.name]:
+                    if (c.has_attr(attr)):
+                        del d[attr]
+            if (c.name == 'p' and c.has_attr('style') and c['style'] == 'margin: 0cm 0cm 0pt;'):
+                d.unwrap()
+                result.append(soup.new_tag('br'))
+            if (c.name in unwrap):
+                if (unwrap[c.name] == []):
+                    d.unwrap()
+                elif (c.has_attr('class') and any(x in c['class'] for x in unwrap[c.name])):
+                    d.unwrap()
+    
+    return result, media
+
+recursive_rules = {
+    'entry': (
+        {'div': ['serendipity_authorpic']},
+        {'p': ['style', 'class'], 'a': ['style', 'class']},
+        {'address': [], 'br': [], 'font': [], 'pre': [], 'span': [], 'div': []},
+    ),
+    'comment': (
+        {'div': ['serendipity_commentcount']},
+        {'p': ['style', 'class'], 'a': ['style', 'class']},
+        {'address': [], 'br': [], 'font': [], 'pre': [], 'span': [], 'div': []},
+    ),
+}
+
+def loadBodies(pages):
+    """Parse all entry and comment bodies of the cached pages, returning (kind, soup, body) tuples."""
+    
+    bodies = []
+    for data in pages['archive']:
+        soup = parseArchivePage(data, 'full')
+        for body in soup('div', class_='serendipity_entry_body'):
+            bodies.append(('entry', soup, body))
+    for data in pages['entry']:
+        soup = parseEntryPage(data, 'full')
+        for body in soup('div', class_='serendipity_commentBody'):
+            bodies.append(('comment', soup, body))
+    return bodies
+
+def bench_rewrite(args):
+    
+    pages = loadCachedPages(args.cache)
+    
+    # golden corpus: both implementations on separately parsed trees
+    mismatches = 0
+    reference = loadBodies(pages)
+    candidate = loadBodies(pages)
+    for (kind, soup, body), (_, soup2, body2) in zip(reference, candidate):
+        content, media = postProcessBodyRecursive(soup, body, *recursive_rules[kind], kind == 'entry')
+        content2, media2 = postProcessBody(soup2, body2, entry_rules if kind == 'entry' else comment_rules, kind == 'entry')
+        if (joinContent(content) != joinContent(content2) or media != media2):
+            mismatches += 1
+    print('{0:d} bodies compared, {1:d} mismatches'.format(len(reference), mismatches))
+    
+    # throughput, each round needs fresh trees as bodies are rewritten in place
+    implementations = [
+        ('recursive', lambda kind, soup, body: postProcessBodyRecursive(soup, body, *recursive_rules[kind], kind == 'entry')),
+        ('iterative', lambda kind, soup, body: postProcessBody(soup, body, entry_rules if kind == 'entry' else comment_rules, kind == 'entry')),
+    ]
+    for name, fn in implementations:
+        elapsed = 0.0
+        count = 0
+        for _ in range(args.repeat):
+            bodies = loadBodies(pages)
+            start = time.perf_counter()
+            for kind, soup, body in bodies:
+                fn(kind, soup, body)
+            elapsed += time.perf_counter() - start
+            count += len(bodies)
+        print('{0:10s} {1:10.1f} bodies/s'.format(name, count / elapsed))
+    
+    return 1 if mismatches else 0
+
+def isBoldStyleLegacy(style):
+    """Previous per-call style normalization as reference."""
+    
+    style = re.sub(' +:', ':', style)
+    style = re.sub(' +;', ';', style)
+    style = ''.join(style.split())
+    style = style.split(';')
+    return 'font-weight:bold' in style
+
+def bench_style(args):
+    
+    pages = loadCachedPages(args.cache)
+    styles = []
+    for kind, soup, body in loadBodies(pages):
+        styles += [t['style'] for t in body.find_all(style=True)]
+    if (not styles):
+        print('No inline styles found.')
+        return 0
+    
+    mismatches = sum(1 for s in styles if isBoldStyleLegacy(s) != inlineStyle.isBold(s))
+    print('{0:d} styles ({1:d} distinct) compared, {2:d} mismatches'.format(len(styles), len(set(styles)), mismatches))
+    
+    implementations = [
+        ('legacy', isBoldStyleLegacy),
+        ('memoized', inlineStyle.isBold),
+    ]
+    for name, fn in implementations:
+        inlineStyle.parseStyle.cache_clear()
+        inlineStyle.styleDict.cache_clear()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for s in styles:
+                fn(s)
+        elapsed = time.perf_counter() - start
+        print('{0:10s} {1:12.1f} styles/s'.format(name, len(styles) * args.repeat / elapsed))
+    print('Cache: {0:s}'.format(inlineStyle.stats()))
+    
+    return 1 if mismatches else 0
+
+def directorySize(directory):
+    return sum(e.stat().st_size for e in os.scandir(directory) if e.is_file())
+
+def bench_storage(args):
+    
+    with openStore(args.directory) as store:
+        posts = list(store.items())
+    if (not posts):
+        print('No posts found.')
+        return 0
+    
+    mismatches = 0
+    print('{0:8s} {1:>12s} {2:>12s} {3:>10s} {4:>10s}'.format('format', 'write/s', 'read/s', 'KiB', 'identical'))
+    for format in sorted(formats):
+        write = 0.0
+        read = 0.0
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as directory:
+                start = time.perf_counter()
+                with openStore(directory, format) as store:
+                    for key, post in posts:
+                        store.write(key, post)
+                write += time.perf_counter() - start
+                
+                start = time.perf_counter()
+                with openStore(directory) as store:
+                    loaded = list(store.items())
+                read += time.perf_counter() - start
+                size = directorySize(directory)
+        identical = (loaded == posts)
+        mismatches += 0 if identical else 1
+        print('{0:8s} {1:12.1f} {2:12.1f} {3:10.1f} {4:>10s}'.format(
+            format,
+            len(posts) * args.repeat / write,
+            len(posts) * args.repeat / read,
+            size / 1024,
+            'yes' if identical else 'NO'
+            ))
+    
+    return 1 if mismatches else 0
+
+def bench_corpus(args):
+    
+    with openStore(args.directory) as store:
+        reference = list(store.items())
+        if (not store.parallel):
+            print('Warning: format \'{0:s}\' is always loaded in a single process.'.format(store.format))
+        
+        mismatches = 0
+        baseline = None
+        print('{0:8s} {1:>12s} {2:>10s} {3:>10s}'.format('workers', 'posts/s', 'speedup', 'identical'))
+        for workers in args.workers:
+            elapsed = 0.0
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                posts = list(loadPosts(store, workers=workers, chunkSize=args.chunk_size))
+                elapsed += time.perf_counter() - start
+            identical = (posts == reference)
+            mismatches += 0 if identical else 1
+            if (baseline is None):
+                baseline = elapsed
+            print('{0:8d} {1:12.1f} {2:10.2f} {3:>10s}'.format(
+                workers,
+                len(posts) * args.repeat / elapsed,
+                baseline / elapsed,
+                'yes' if identical else 'NO'
+                ))
+    print('{0:d} CPUs available.'.format(os.cpu_count() or 1))
+    
+    return 1 if mismatches else 0
+
+def loadAll(directory):
+    """Previous transfer loading, keeping every post in memory."""
+    
+    with openStore(directory) as store:
+        posts = [post for key, post in loadPosts(store, workers=1)]
+    categories = set()
+    authorIds = set()
+    for post in posts:
+        categories.update(post['categories'])
+        authorIds.add(post['author_id'])
+    for post in posts:
+        len(post['content'])
+    return len(posts)
+
+def twoPass(directory):
+    """Metadata from the post index, then posts streamed from disk one at a time."""
+    
+    with openStore(directory) as store, PostIndex(directory) as index:
+        index.update(store, workers=1)
+        categories = index.categories()
+        authorIds = index.authorIds()
+    count = 0
+    for key, post in streamPosts(directory, workers=1):
+        len(post['content'])
+        # categories and author are looked up per post, like the transfer does
+        if (post['author_id'] in authorIds and categories.issuperset(post['categories'])):
+            count += 1
+    return count
+
+def bench_memory(args):
+    
+    with openStore(args.directory) as store:
+        posts = list(store.items())
+    
+    print('{0:8s} {1:>8s} {2:>14s} {3:>14s}'.format('scale', 'posts', 'load all KiB', 'two-pass KiB'))
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as directory:
+            with openStore(directory, args.format) as store:
+                for i in range(scale):
+                    for key, post in posts:
+                        store.write('{0:04d}-{1:s}'.format(i, key), post)
+            count, _, peak_all = measure(loadAll, directory)
+            count_stream, _, peak_stream = measure(twoPass, directory)
+            if (count_stream != count):
+                print('Two-pass loading only found metadata of {0:d} of {1:d} posts.'.format(count_stream, count))
+        print('{0:8d} {1:8d} {2:14.1f} {3:14.1f}'.format(scale, count, peak_all / 1024, peak_stream / 1024))
+    
+    return 0
+
+def reworkContentLegacy(content):
+    """Previous content rework of oauth.py transfer as reference, one re.sub per rule."""
+    
+    content = re.sub(r'\r\n<br/>\r\n', r'\r\n', content)
+    content = re.sub(r'<p>\s*</p>', r'', content)
+    content = re.sub(r'\xA0', r'', content) #nbsp;
+    content = re.sub(r'(\w+)\r\n<a(.*)</a>\r\n(\w+)', r'\1 <a\2</a> \3', content)
+    content = re.sub(r'</a>\r\n([.:,])', r'</a>\1', content)
+    content = re.sub(r'(\s+)([,.:\w\-\(\)]+)\s*\r\n(?!\d)([.,:\w\-\(\)]+)(\s)', r'\1\2 \3\4', content)
+    content = re.sub(r'(\s+)([,.:\w\-\(\)]+)\r\n\s*(?!\d)([.,:\w\-\(\)]+)(\s)', r'\1\2 \3\4', content)
+    content = re.sub(r'(\s+)-\r\n(\s+)([.,\w\-\(\)]+)', r'\1-\2\3', content)
+    return content
+
+# fragments of random content, weighted towards what the rules look for
+content_fragments = [
+    '\r\n', '\r\n', '\r\n', ' ', ' ', ' ', '\t', '\n', '\r', '\x85', '\xA0',
+    '<br/>', '<p>', '</p>', '<a href="x">', '<a', '</a>', '<', '>', '/', '"',
+    'a', 'b', 'ab', '\xE4', '1', '2', '\u0663', '-', '-', '.', ',', ':', '(', ')',
+]
+
+# large synthetic posts by size, including inputs that are quadratic for backtracking rules
+content_cases = [
+    ('prose',  lambda n: 'Lorem ipsum dolor\r\nsit amet, <a href="x">link</a>\r\n, more -\r\n text.\r\n<br/>\r\n<p> </p>\xA0' * (n // 80)),
+    ('breaks', lambda n: ' word\r\n' * (n // 7)),
+    ('links',  lambda n: 'x\r\n<a' + '</a>' * (n // 4)),
+    ('spaces', lambda n: ' ' * n + 'word'),
+    ('word',   lambda n: 'w' * n + ' '),
+]
+
+def bench_content(args):
+    
+    mismatches = 0
+    
+    if (args.directory):
+        count = 0
+        for key, post in streamPosts(args.directory):
+            count += 1
+            if (reworkContent(post['content']) != reworkContentLegacy(post['content'])):
+                print('Post {0:s} differs.'.format(key))
+                mismatches += 1
+        print('{0:d} posts, {1:d} differ'.format(count, mismatches))
+    
+    rnd = random.Random(args.seed)
+    differ = 0
+    for _ in range(args.fuzz):
+        content = ''.join(rnd.choice(content_fragments) for _ in range(rnd.randint(0, 100)))
+        if (reworkContent(content) != reworkContentLegacy(content)):
+            if (differ == 0):
+                print('Random content {0!r} differs.'.format(content))
+            differ += 1
+    print('{0:d} random contents, {1:d} differ'.format(args.fuzz, differ))
+    mismatches += differ
+    
+    print('{0:8s} {1:>8s} {2:>12s} {3:>12s} {4:>12s} {5:>10s}'.format('case', 'KiB', 'legacy ms', 'ms', 'MiB/s', 'identical'))
+    for name, generate in content_cases:
+        for size in args.sizes:
+            content = generate(size)
+            start = time.perf_counter()
+            reference = reworkContentLegacy(content)
+            legacy = time.perf_counter() - start
+            start = time.perf_counter()
+            result = reworkContent(content)
+            elapsed = time.perf_counter() - start
+            identical = (result == reference)
+            mismatches += not identical
+            print('{0:8s} {1:8.1f} {2:12.2f} {3:12.2f} {4:12.1f} {5:>10s}'.format(
+                name,
+                len(content) / 1024,
+                1000 * legacy,
+                1000 * elapsed,
+                len(content) / elapsed / 1024 / 1024,
+                'yes' if identical else 'NO'
+                ))
+    
+    return 1 if mismatches else 0
+
+# (consumer key, consumer secret, token, token secret, method, url, parameters, OAuth parameters, nonce, timestamp, signature)
+# the first two are the examples of the Twitter API documentation and of the OAuth Core 1.0 specification (Appendix A),
+# the remaining ones were computed using oauthlib
+oauth_vectors = [
+    ('xvz1evFS4wEEPTGEFPHBog', 'kAcSOqF21Fu85e7zjz7ZN2U4ZRhfV3WpwPAoE3Z7kBw', '370773112-GmHxMAgYyLbNEtIKZeRNFsMKPR9EyMZeS9weJAEb', 'LswwdoUaIvS8ltyTt5jkRh4J50vUPVVHtR2YPi5kE',
+        'POST', 'https://api.twitter.com/1.1/statuses/update.json', {'include_entities': 'true', 'status': 'Hello Ladies + Gentlemen, a signed OAuth request!'}, {},
+        'kYjzVBB8Y0ZFabxSWbWovY3uYSQ2pTgmZeNu2VS4cg', '1318622958', 'hCtSmYh+iHYCEqBWrE7C7hYmtUk='),
+    ('dpf43f3p2l4k3l03', 'kd94hf93k423kf44', 'nnch734d00sl2jdk', 'pfkkdhi9sl3r4s00',
+        'GET', 'http://photos.example.net/photos', {'file': 'vacation.jpg', 'size': 'original'}, {},
+        'kllo9940pd9333jh', '1191242096', 'tR3+Ty81lMeYAr/Fid0kMTYa/WM='),
+    ('9djdj82h48djs9d2', 'j49sk3j29djd', None, None,
+        'POST', 'https://wordpress.example.com/oauth1/request', {}, {'oauth_callback': 'oob'},
+        'n0nce', '1545001200', 'b5Oh5M5QT7AeyX3mmTrfeWjoB+U='),
+    ('9djdj82h48djs9d2', 'j49sk3j29djd', 'kkk9d7dh3k39sjv7', 'dh893hdasih9',
+        'POST', 'https://wordpress.example.com/oauth1/access', {}, {'oauth_callback': 'oob', 'oauth_verifier': 'hfdp7dh39dks9884'},
+        'n0nce', '1545001200', '3wq/erQFxqRe9K2Pjg09D5NSO44='),
+    ('9djdj82h48djs9d2', 'j49sk3j29djd', 'kkk9d7dh3k39sjv7', 'dh893hdasih9',
+        'GET', 'https://wordpress.example.com/wp-json/wp/v2/categories', {'page': '2', 'per_page': '100'}, {},
+        '5f0c1e2d3a4b', '1545001200', 'Zs59iHE+SbdqZGq3DlzWrvx0Rn4='),
+    ('9djdj82h48djs9d2', 'j49sk3j29djd', 'kkk9d7dh3k39sjv7', 'dh893hdasih9',
+        'GET', 'https://wordpress.example.com/wp-json/wp/v2/posts', {'a': 'z', 'ab': 'c', 'c@': '', 'b5': '=%3D', '\xFC': '\xE4 ~/+!*'}, {},
+        'n0nce', '1545001200', 'Ej+69JOS4vbXM3tmcUW3VTnEPpU='),
+]
+
+def getOAuthHeaderLegacy(consumerKey, consumerSecret, token, tokenSecret, method, url, query_post_params):
+    """Previous OAuth10a.getOAuthHeader as reference, i.e. nonce of random digits, fresh HMAC and everything encoded per call."""
+    
+    oauth_params = {
+        'oauth_consumer_key':     consumerKey,
+        'oauth_signature_method': 'HMAC-SHA1',
+        'oauth_version':          '1.0',
+        'oauth_timestamp':        str(int(datetime.now().timestamp())),
+        'oauth_nonce':            ''.join([str(random.randint(0, 9)) for i in range(8)]),
+        'oauth_token':            token,
+    }
+    terms = sorted(list(oauth_params.items()) + list(query_post_params.items()), key=lambda x: x[0] + x[1])
+    text = method + '&' + quote(url, safe='') + '&' + quote('&').join([quote(k) + quote('=') + quote(v) for k, v in terms])
+    key = quote(consumerSecret) + '&' + quote(tokenSecret)
+    hashed = hmac.new(key.encode('utf-8'), text.encode('utf-8'), sha1)
+    oauth_params['oauth_signature'] = b64encode(hashed.digest()).decode('utf-8')
+    parts = ['{0:s}="{1:s}"'.format(quote(k, safe='-._~'), quote(v, safe='-._~')) for k, v in sorted(oauth_params.items(), key=lambda x: x[0] + x[1])]
+    return 'Authorization: OAuth ' + ', '.join(parts)
+
+def headerSignature(header):
+    return unquote(re.search(r'oauth_signature="([^"]*)"', header).group(1))
+
+def headerNonce(header):
+    return re.search(r'oauth_nonce="([^"]*)"', header).group(1)
+
+def bench_oauth(args):
+    
+    failed = 0
+    for ix, (ck, cs, t, ts, method, url, params, oauth_params, nonce, timestamp, expected) in enumerate(oauth_vectors):
+        oauth = OAuth10a(ck, cs, t, ts)
+        signature = headerSignature(oauth.getOAuthHeader(method, url, params, oauth_params, timestamp, nonce))
+        if (signature != expected):
+            print('Test vector {0:d} failed: {1:s} instead of {2:s}'.format(ix, signature, expected))
+            failed += 1
+    print('{0:d} test vectors, {1:d} failed'.format(len(oauth_vectors), failed))
+    
+    ck, cs, t, ts, method, url, params, oauth_params, nonce, timestamp, expected = oauth_vectors[-2]
+    oauth = OAuth10a(ck, cs, t, ts)
+    
+    # concurrent signing with a fixed nonce must give the same signature in every thread
+    def signFixed(_):
+        return headerSignature(oauth.getOAuthHeader(method, url, params, oauth_params, timestamp, nonce))
+    with ThreadPoolExecutor(args.threads) as pool:
+        signatures = set(pool.map(signFixed, range(args.count)))
+    if (signatures != {expected}):
+        print('Concurrent signing gave {0:d} different signatures.'.format(len(signatures)))
+        failed += 1
+    
+    def signLegacy(_):
+        return getOAuthHeaderLegacy(ck, cs, t, ts, method, url, params)
+    def sign(_):
+        return oauth.getOAuthHeader(method, url, params)
+    
+    print('{0:10s} {1:>8s} {2:>10s} {3:>14s} {4:>18s}'.format('signing', 'threads', 'count', 'signatures/s', 'nonce collisions'))
+    for name, fn, threads in [('legacy', signLegacy, 1), ('current', sign, 1), ('current', sign, args.threads)]:
+        start = time.perf_counter()
+        if (threads == 1):
+            headers = [fn(i) for i in range(args.count)]
+        else:
+            with ThreadPoolExecutor(threads) as pool:
+                headers = list(pool.map(fn, range(args.count)))
+        elapsed = time.perf_counter() - start
+        nonces = {headerNonce(h) for h in headers}
+        print('{0:10s} {1:8d} {2:10d} {3:14.0f} {4:18d}'.format(name, threads, args.count, args.count / elapsed, len(headers) - len(nonces)))
+    
+    return 1 if failed else 0
+
+def main():
+    
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(title='benchmark', dest='benchmark', help='benchmark to run', required=True)
+    parser_parse = subparsers.add_parser('parse', help='HTML parsing backends on cached pages')
+    parser_parse.add_argument('--repeat', type=int, default=3)
+    parser_parse.add_argument('cache', help='cache directory populated by collectBlog.py --cache')
+    parser_rewrite = subparsers.add_parser('rewrite', help='postProcessBody against the recursive implementation')
+    parser_rewrite.add_argument('--repeat', type=int, default=3)
+    parser_rewrite.add_argument('cache', help='cache directory populated by collectBlog.py --cache')
+    parser_style = subparsers.add_parser('style', help='memoized inline style parsing against per-call normalization')
+    parser_style.add_argument('--repeat', type=int, default=20)
+    parser_style.add_argument('cache', help='cache directory populated by collectBlog.py --cache')
+    parser_storage = subparsers.add_parser('storage', help='write/read throughput of post storage formats')
+    parser_storage.add_argument('--repeat', type=int, default=3)
+    parser_storage.add_argument('directory', help='scrape directory to take posts from')
+    parser_corpus = subparsers.add_parser('corpus', help='parallel post loading at different numbers of worker processes')
+    parser_corpus.add_argument('--repeat', type=int, default=3)
+    parser_corpus.add_argument('--workers', type=lambda x: [int(e) for e in x.split(',')], default=[1, 2, 4, 8], help='comma-separated worker counts (default: 1,2,4,8)')
+    parser_corpus.add_argument('--chunk-size', type=int, default=16)
+    parser_corpus.add_argument('directory', help='scrape directory to take posts from')
+    parser_memory = subparsers.add_parser('memory', help='peak memory of loading all posts against two-pass streaming at growing corpus sizes')
+    parser_memory.add_argument('--scales', type=lambda x: [int(e) for e in x.split(',')], default=[1, 4, 16], help='comma-separated corpus size multipliers (default: 1,4,16)')
+    parser_memory.add_argument('--format', choices=sorted(formats), default='yaml', help='storage format of the generated corpora')
+    parser_memory.add_argument('directory', help='scrape directory to take posts from')
+    parser_content = subparsers.add_parser('content', help='content rework against one re.sub per rule on posts, random and large synthetic content')
+    parser_content.add_argument('--fuzz', type=int, default=20000, help='number of random contents to compare')
+    parser_content.add_argument('--seed', type=int, default=0)
+    parser_content.add_argument('--sizes', type=lambda x: [int(e) for e in x.split(',')], default=[1000, 2000, 4000, 8000], help='comma-separated sizes of synthetic content in characters (default: 1000,2000,4000,8000)')
+    parser_content.add_argument('directory', nargs='?', help='scrape directory to take posts from')
+    parser_oauth = subparsers.add_parser('oauth', help='OAuth 1.0a test vectors and signatures per second against the previous implementation')
+    parser_oauth.add_argument('--count', type=int, default=100000, help='number of signatures per run')
+    parser_oauth.add_argument('--threads', type=int, default=8)
+    
+    args = parser.parse_args()
+    
+    if (args.benchmark == 'parse'):
+        return bench_parse(args)
+    elif (args.benchmark == 'rewrite'):
+        return bench_rewrite(args)
+    elif (args.benchmark == 'style'):
+        return bench_style(args)
+    elif (args.benchmark == 'storage'):
+        return bench_storage(args)
+    elif (args.benchmark == 'corpus'):
+        return bench_corpus(args)
+    elif (args.benchmark == 'memory'):
+        return bench_memory(args)
+    elif (args.benchmark == 'content'):
+        return bench_content(args)
+    elif (args.benchmark == 'oauth'):
+        return bench_oauth(args)
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+
+# central european (summer) time
+cet  = timezone(timedelta(hours=1))
+cest = timezone(timedelta(hours=2))
+
+# serendipity uses the language of the blog, accept both
+weekdays = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3, 'friday': 4, 'saturday': 5, 'sunday': 6,
+    'montag': 0, 'dienstag': 1, 'mittwoch': 2, 'donnerstag': 3, 'freitag': 4, 'samstag': 5, 'sonnabend': 5, 'sonntag': 6,
+}
+months = {
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
+    'januar': 1, 'februar': 2, 'märz': 3, 'maerz': 3, 'mai': 5, 'juni': 6,
+    'juli': 7, 'oktober': 10, 'dezember': 12,
+}
+
+# e.g. 'Sunday, 20. October 2019'
+date_re = re.compile(r'(\w+),\s*(\d{1,2})\.\s*(\w+)\s+(\d{4})')
+# e.g. '20.10.2019 14:05'
+datetime_re = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})\s+(\d{1,2}):(\d{2})')
+# e.g. '14:05'
+time_re = re.compile(r'(\d{1,2}):(\d{2})')
+
+@lru_cache(maxsize=4096)
+def parseDate(string):
+    """Parse an archive date header ('%A, %d. %B %Y') independent of the current locale."""
+    
+    m = date_re.fullmatch(string.strip())
+    if (m is None or m.group(1).lower() not in weekdays or m.group(3).lower() not in months):
+        raise ValueError('invalid date \'{0:s}\''.format(string))
+    return datetime(int(m.group(4)), months[m.group(3).lower()], int(m.group(2)))
+
+@lru_cache(maxsize=4096)
+def parseDateTime(string):
+    """Parse a comment date ('%d.%m.%Y %H:%M')."""
+    
+    m = datetime_re.fullmatch(string.strip())
+    if (m is None):
+        raise ValueError('invalid date \'{0:s}\''.format(string))
+    return datetime(*(int(x) for x in reversed(m.groups()[:3])), int(m.group(4)), int(m.group(5)))
+
+@lru_cache(maxsize=4096)
+def parseTime(string):
+    """Parse an entry time ('%H:%M')."""
+    
+    m = time_re.fullmatch(string.strip())
+    if (m is None):
+        raise ValueError('invalid time \'{0:s}\''.format(string))
+    return time(int(m.group(1)), int(m.group(2)))
+
+def lastSunday(year, month):
+    
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - 6) % 7)
+
+@lru_cache(maxsize=None)
+def summertime(year):
+    """First and last day of summer time in the EU (since 1996)."""
+    return lastSunday(year, 3), lastSunday(year, 10)
+
+def getTimezone(day, t):
+    """UTC offset of local time t on day.
+    
+    Summer time lasts from 02:00 on the last Sunday of March until 03:00 on the last Sunday of October.
+    The repeated hour on the last day is taken as summer time.
+    """
+    
+    start, end = summertime(day.year)
+    if (start < day < end):
+        return cest
+    elif (day == start):
+        return cest if (t.hour >= 3) else cet
+    elif (day == end):
+        return cest if (t.hour < 3) else cet
+    return cet
+
+def localize(dt):
+    """Attach the local UTC offset to a naive datetime."""
+    return dt.replace(tzinfo=getTimezone(dt.date(), dt.time()))
@@ -6,51 +6,43 @@ __copyright__ = "Copyright (c) 2018–2019"
 __license__ = "MIT"
 
 import code
-import os
 import sys
 import argparse
-import locale
-import yaml
-from datetime import datetime, timedelta, timezone
+import time
+from postIndex import PostIndex, groups
+from storage import openStore
 
 def main():
     parser=argparse.ArgumentParser()
+    parser.add_argument('--group-by', default=None, help='count posts and comments by comma-separated fields ({0:s})'.format(', '.join(sorted(groups))))
+    parser.add_argument('--workers', type=int, default=None, help='number of processes for parsing posts (default: number of CPUs)')
     parser.add_argument('dir', help='directory to process')
     
     args = parser.parse_args()
     
-    blogEntries = []
+    if (args.group_by is not None):
+        args.group_by = args.group_by.split(',')
+        if (not all(f in groups for f in args.group_by)):
+            parser.error('invalid --group-by \'{0:s}\''.format(','.join(args.group_by)))
+    
+    start = time.perf_counter()
+    with openStore(args.dir) as store, PostIndex(args.dir) as index:
+        updated, removed, unchanged = index.update(store, args.workers)
+        print('Index: {0:d} posts updated, {1:d} removed, {2:d} unchanged ({3:.1f} ms).'.format(updated, removed, unchanged, 1000 * (time.perf_counter() - start)))
+        
+        if (args.group_by is not None):
+            print('\t'.join(args.group_by + ['posts', 'comments']))
+            for row in index.groupBy(args.group_by):
+                print('\t'.join(str(e) for e in row))
+            return 0
+        
+        year = None
+        for y, month, num, comments in index.groupBy(['year', 'month'], descending=True):
+            if (y != year):
+                year = y
+                print(f'Year {year}:')
+            print(f'\t{month}: {num}')
     
-    for entry in os.scandir(args.dir):
-        if (not entry.is_file()):
-            continue
-        if (entry.name == 'authors.yml'):
-            continue
-        if (not(entry.name.endswith('.yml'))):
-            continue
-        with open(entry.path, 'r') as f:
-            data = yaml.load(f)
-        blogEntries.append(data)
-    
-    archive = {}
-    for year in range(2009, 2019):
-        archive[year] = {}
-        for month in range(1, 13):
-            archive[year][month] = []
-    
-    for entry in blogEntries:
-        date = datetime.fromisoformat(entry['date'])
-        archive[date.year][date.month].append(entry)
-    
-    for year in reversed(range(2009, 2019)):
-        print(f'Year {year}:')
-        for month in reversed(range(1, 13)):
-            num = len(archive[year][month])
-            if (num):
-                print(f'\t{month}: {num}')
-    
-    for entry in archive[2010][3]:
-        print(entry['title'])
     return 0
     
 if __name__ == '__main__':
@@ -9,69 +9,136 @@ import code
 import os
 import sys
 import argparse
-import locale
-import pycurl
 import yaml
 import re
 from copy import copy
-from datetime import datetime, timedelta, timezone
-from io import BytesIO
-from bs4 import BeautifulSoup
+from hashlib import sha1, sha256
+from datetime import datetime
 from bs4.element import Tag, NavigableString, Comment
+from blogDate import parseDate, parseDateTime, parseTime, localize
+from contentTransform import media_placeholder
+from crawler import Crawler
+from httpCache import HttpCache, HttpCacheMiss
+from httpClient import HttpClient
+from requestPolicy import RequestPolicy
+from mediaDownloader import MediaDownloader
+from mediaStore import MediaStore
+import inlineStyle
+from pageParser import parsers, parseArchivePage, parseEntryPage
+from storage import formats, detectFormat, openStore
 
-# 02:00 on start day until 03:00 end day
-germany_summertime = {
-    2009: {'start': {'day': 29, 'month': 3}, 'end': {'day': 25, 'month': 10}},
-    2010: {'start': {'day': 28, 'month': 3}, 'end': {'day': 31, 'month': 10}},
-    2011: {'start': {'day': 27, 'month': 3}, 'end': {'day': 30, 'month': 10}},
-    2012: {'start': {'day': 25, 'month': 3}, 'end': {'day': 28, 'month': 10}},
-    2013: {'start': {'day': 31, 'month': 3}, 'end': {'day': 27, 'month': 10}},
-    2014: {'start': {'day': 30, 'month': 3}, 'end': {'day': 26, 'month': 10}},
-    2015: {'start': {'day': 29, 'month': 3}, 'end': {'day': 25, 'month': 10}},
-    2016: {'start': {'day': 27, 'month': 3}, 'end': {'day': 30, 'month': 10}},
-    2017: {'start': {'day': 26, 'month': 3}, 'end': {'day': 29, 'month': 10}},
-    2018: {'start': {'day': 25, 'month': 3}, 'end': {'day': 28, 'month': 10}},
-    2019: {'start': {'day': 31, 'month': 3}, 'end': {'day': 27, 'month': 10}},
-}
-
-def getTimezone(date, time):
-    tz = timezone(timedelta(hours=1))
-    summertime = germany_summertime[date.year]
-    if (
-        (
-            date.month > summertime['start']['month']
-            or (
-                date.month == summertime['start']['month']
-                and date.day >= summertime['start']['day']
-                and time.hour > 2
-            )
-        )
-        and (
-            date.month < summertime['end']['month']
-            or (
-                date.month == summertime['end']['month']
-                and date.day <= summertime['end']['day']
-                and time.hour < 3
-            )
+def compileRules(exclude, strip_attr, unwrap):
+    """Compile postProcessBody rules into a dispatch table by tag name.
+    
+    exclude:    tag name -> classes of tags to drop
+    strip_attr: tag name -> attributes to remove
+    unwrap:     tag name -> classes of tags to unwrap (or [] to always unwrap)
+    """
+    
+    rules = {}
+    for name in set(exclude) | set(strip_attr) | set(unwrap) | {'a', 'p', 'span'}:
+        unwrap_rule = None
+        if (name in unwrap):
+            unwrap_rule = True if unwrap[name] == [] else frozenset(unwrap[name])
+        rules[name] = (
+            frozenset(exclude[name]) if name in exclude else None,
+            tuple(strip_attr.get(name, [])),
+            unwrap_rule,
         )
-    ):
-        tz = timezone(timedelta(hours=2))
-    return tz
+    return rules
+
+entry_rules = compileRules(
+    {'div': ['serendipity_authorpic']},
+    {'p': ['style', 'class'], 'a': ['style', 'class']},
+    {'address': [], 'br': [], 'font': [], 'pre': [], 'span': [], 'div': []},
+    )
+
+comment_rules = compileRules(
+    {'div': ['serendipity_commentcount']},
+    {'p': ['style', 'class'], 'a': ['style', 'class']},
+    {'address': [], 'br': [], 'font': [], 'pre': [], 'span': [], 'div': []},
+    )
+
+def mergeStrings(tag):
+    
+    run = []
+    for c in tag.contents + [None]:
+        if (type(c) == NavigableString):
+            run.append(c)
+            continue
+        if (run):
+            text = ''.join(run)
+            if (len(run) > 1 or text == ''):
+                for e in run[1:]:
+                    e.extract()
+                if (text == ''):
+                    run[0].extract()
+                else:
+                    run[0].replace_with(NavigableString(text))
+            run = []
 
-def postProcessBody(soup, body, exclude, strip_attr, unwrap, transAddress):
+def joinContent(body):
+    
+    # str() of a comment (i.e. a media placeholder) is only its text
+    return '\r\n'.join(filter(None, [(e.output_ready() if type(e) == Comment else str(e)).strip() for e in body.contents]))
+
+def postProcessBody(soup, body, rules, placeholders=False):
+    """Rewrite body in place according to compiled rules, returning body and media found.
+    
+    If placeholders is set, stripped images are replaced by a media placeholder (see contentTransform.placeMedia).
+    
+    The tree is walked iteratively: tags are checked for exclusion when first visited
+    (in document order) and rewritten once all of their children are done.
+    Adjacent strings are merged within tags that are kept, where this does not change the output.
+    """
     
-    result = copy(body)
-    result.clear()
     media = []
+    stack = [(c, False) for c in reversed(body.contents)]
     
-    for c in body.children:
+    while (stack):
+        c, done = stack.pop()
+        
+        if (done):
+            rule = rules.get(c.name)
+            if (rule is None):
+                mergeStrings(c)
+                continue
+            exclude, strip_attr, unwrap = rule
+            style = c.get('style')
+            classes = c.get('class', [])
+            # strings are only merged within tags that are kept,
+            # unwrapped ones are merged as part of their parent
+            keep = c
+            if (c.name == 'span' and style is not None and inlineStyle.isBold(style)):
+                keep = soup.new_tag('b')
+                c.wrap(keep)
+            for attr in strip_attr:
+                if (attr in c.attrs):
+                    del c[attr]
+            # special-case p style="margin: 0cm 0cm 0pt;" --> <br/>
+            if (c.name == 'p' and style is not None and inlineStyle.isMarginBreak(style)):
+                c.insert_after(soup.new_tag('br'))
+                c.unwrap()
+                keep = None
+            elif (unwrap is True or (unwrap is not None and not unwrap.isdisjoint(classes))):
+                c.unwrap()
+                if (keep is c):
+                    keep = None
+            if (keep is not None):
+                mergeStrings(keep)
+            continue
+        
         if (type(c) == NavigableString):
-            result.append(NavigableString(c.string.strip('\r\n')))
+            stripped = c.strip('\r\n')
+            if (stripped != c):
+                c.replace_with(NavigableString(stripped))
         elif (type(c) == Tag):
-            if (c.name in exclude and c.has_attr('class')):
-                if (any(x in c['class'] for x in exclude[c.name])):
+            rule = rules.get(c.name)
+            if (rule is not None and rule[0] is not None and c.has_attr('class')):
+                if (not rule[0].isdisjoint(c['class'])):
+                    c.decompose()
                     continue
-            # strip serendipity images,, but include info in media
+            # strip serendipity images, but include info in media
             if (c.name == 'a' and c.has_attr('class') and 'serendipity_image_link' in c['class']):
                 img = c('img', class_=lambda x: x.startswith('serendipity_image'))[0]
                 s9ymdb_ix = -1
@@ -80,62 +147,28 @@ def postProcessBody(soup, body, exclude, strip_attr, unwrap, transAddress):
                     comment = prev.string.strip()
                     if (comment.startswith('s9ymdb:')):
                         s9ymdb_ix = int(comment[7:])
+                if (placeholders):
+                    c.insert_before(Comment(media_placeholder.format(len(media))))
                 media.append({'url': c['href'], 's9ymdb_index': s9ymdb_ix, 'filename': os.path.basename(c['href'])})
+                c.decompose()
                 continue
-            d, dm = postProcessBody(soup, c, exclude, strip_attr, unwrap, transAddress)
-            media += dm
-            if (c.name == 'span' and 'style' in c.attrs):
-                # normalize
-                style = c.attrs['style']
-                style = re.sub(' +:', ':', style)
-                style = re.sub(' +;', ';', style)
-                style = ''.join(style.split())
-                style = style.split(';')
-                if ('font-weight:bold' in style):
-                    b_tag = soup.new_tag('b')
-                    b_tag.append(d)
-                    result.append(b_tag)
-                else:
-                    result.append(d)
-            else:
-                result.append(d)
-            if (c.name in strip_attr):
-                for attr in strip_attr[c.name]:
-                    if (c.has_attr(attr)):
-                        del d[attr]
-            # special-case p style="margin: 0cm 0cm 0pt;" --> <br/>
-            if (c.name == 'p' and c.has_attr('style') and c['style'] == 'margin: 0cm 0cm 0pt;'):
-                d.unwrap()
-                result.append(soup.new_tag('br'))
-            if (c.name in unwrap):
-                if (unwrap[c.name] == []):
-                    d.unwrap()
-                elif (c.has_attr('class') and any(x in c['class'] for x in unwrap[c.name])):
-                    d.unwrap()
+            stack.append((c, True))
+            stack.extend((e, False) for e in reversed(c.contents))
         elif (type(c) == Comment):
-            continue
+            c.extract()
         else:
             print('Info: found unknown type {0!s}'.format(type(c)))
             print('-'*72)
             print(c)
             print('-'*72)
+            c.extract()
     
-    # merge adjacent NavigableString
-    
-    return result, media
+    return body, media
 
-def processCommentPage(url):
-    
-    buffer = BytesIO()
-    c = pycurl.Curl()
-    c.setopt(c.URL, url)
-    c.setopt(c.WRITEDATA, buffer)
-    c.perform()
-    c.close()
+def processCommentPage(url, soup):
     
     results = {'url': url, 'entries': []}
     media = []
-    soup = BeautifulSoup(buffer.getvalue().decode('UTF-8'), 'lxml')
     comments_area = soup('div', class_='serendipity_section_comments')[0]
     
     for comment in comments_area('div', class_='serendipity_comment'):
@@ -145,185 +178,460 @@ def processCommentPage(url):
         
         author = list(source('span', class_='comment_source_author')[0].stripped_strings)[0]
         date = source('span', class_='comment_source_date')[0].string
-        date = datetime.strptime(date, '%d.%m.%Y %H:%M')
-        tz = getTimezone(date.date(), date.time())
-        date = date.replace(tzinfo=tz)
+        date = localize(parseDateTime(date))
         
-        body, comment_media = postProcessBody(
-            soup,
-            body,
-            {'div': ['serendipity_commentcount']},
-            {'p': ['style', 'class'], 'a': ['style', 'class']},
-            {'address': [], 'br': [], 'font': [], 'pre': [], 'span': [], 'div': []},
-            False
-            )
+        body, comment_media = postProcessBody(soup, body, comment_rules)
         media += comment_media
         
         results['entries'].append(
             {
                 'date': str(date),
                 'authorName': str(author),
-                'content': '\r\n'.join(filter(None, [str(e).strip() for e in body.contents])),
+                'content': joinContent(body),
             }
         )
     
     return results, media
 
-def main():
+def processExtendedPage(entry, subsoup):
+    
+    entry_contents = subsoup('div', class_='serendipity_entry')[0]
+    entry_extended = entry_contents('div', class_='serendipity_entry_extended')[0]
+    for c in entry_extended.children:
+        if (c.name == 'a' and c.has_attr('id') and c['id'] == 'extended'):
+            continue
+        entry['body'].append(copy(c))
+
+# e.g. '(Seite 1 von 8, insgesamt 40 Einträge)'
+pagination_re = re.compile(r'\((?:Seite|Page)\s+(\d+)\s+(?:von|of)\s+(\d+)')
+page_link_re = re.compile(r'/archives/P(\d+)\.html')
+
+def entryKey(url):
+    
+    # s9y entry URLs look like /index.php?/archives/123-Some-Title.html
+    # padded to a fixed width, so keys sort by entry id
+    m = re.search(r'/archives/(\d+)-', url)
+    if (m):
+        return '{0:06d}'.format(int(m.group(1)))
+    return sha1(url.encode('utf-8')).hexdigest()[:12]
+
+def loadManifest(directory):
+    
+    path = os.path.join(directory, 'manifest.yml')
+    if (not os.path.exists(path)):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.load(f) or {}
+
+def dumpManifest(manifest):
+    
+    # one flow-style line per entry, so entries can be appended
+    return yaml.dump(manifest, allow_unicode=True, default_flow_style=None, width=float('inf'))
+
+def appendManifest(directory, url, record):
+    
+    with open(os.path.join(directory, 'manifest.yml'), 'a', encoding='utf-8') as f:
+        f.write(dumpManifest({url: record}))
 
-    site = 'http://blog.bingo-ev.de'
+def writeManifest(directory, manifest):
+    
+    path = os.path.join(directory, 'manifest.yml')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(dumpManifest(manifest))
+    os.replace(path + '.tmp', path)
+
+def processArchivePage(crawl, soup, content):
+    
+    site = crawl['site']
+    entries = []
+    
+    for entry in content('div', class_='serendipity_Entry_Date', recursive=False):
+        
+        # extract date
+        date = entry('h3', class_='serendipity_date')
+        date = parseDate(date[0].string)
+        
+        # FIXME: while loop here
+        for ix, title in enumerate(entry('h4', class_='serendipity_title')):
+            
+            # extract title
+            url = title.a['href']
+            title = title.a.string
+            
+            # body and footer
+            entry_contents = entry('div', class_='serendipity_entry')[ix]
+            entry_body = entry_contents('div', class_='serendipity_entry_body')[0]
+            entry_footer = entry_contents('div', class_='serendipity_entryFooter')[0]
+            
+            # extract author and time
+            entry_footer_fields = entry_footer.contents
+            entry_footer_strings = list(entry_footer.stripped_strings)
+            categories_beg = entry_footer_strings.index('in') + 1
+            time_beg = entry_footer_strings.index('um') + 1
+            comments_beg = -1 if '|' not in entry_footer_strings else entry_footer_strings.index('|') + 1
+            
+            # extract category (without commas)
+            categories = [str(e.string) for e in entry_footer_fields[categories_beg:time_beg - 1] if e.string != ', ']
+            
+            # extract time
+            time  = entry_footer_fields[time_beg].string
+            time = parseTime(time)
+            # figure out UTC offset
+            date = localize(datetime.combine(date.date(), time))
+            
+            # extract author ID and name
+            author_field = entry_footer_fields[1]
+            author_id = -1
+            author = author_field.string
+            if ('href' in author_field.attrs and author_field['href'].startswith(crawl['author_url'])):
+                author_string = author_field['href'][len(crawl['author_url']):]
+                # extract ID from 99-First-Last
+                author_id = int(author_string.split('-', 1)[0])
+            else:
+                print('Warning: Author {0:s} without ID in {1:s}!'.format(author, title))
+            
+            entry = {
+                'soup':       soup,
+                'body':       entry_body,
+                'date':       date,
+                'author':     str(author),
+                'author_id':  author_id,
+                'categories': categories,
+                'title':      title,
+                'url':        (site + url) if url.startswith('/') else url,
+                'comments':   [],
+                'pending':    False,
+                'post':       None,
+            }
+            entries.append(entry)
+            
+            if (crawl['manifest'] is not None):
+                # teaser, footer and comment count as shown in the archive
+                entry['hash'] = sha256((str(title) + str(entry_contents)).encode('utf-8')).hexdigest()
+                known = crawl['manifest'].get(entry['url'])
+                if (
+                    known is not None
+                    and known['hash'] == entry['hash']
+                    and known.get('key') in crawl['store']
+                ):
+                    entry['skipped'] = True
+                    crawl['unchanged'] += 1
+                    # media of an interrupted run, media already stored are skipped
+                    for link, filename in known.get('media', []):
+                        queueMedia(crawl, link, filename)
+                    continue
+            
+            # check if extended entry and download content if so
+            extended_url = None
+            entry_extended_link = entry_contents('a', href=lambda x: x.endswith('#extended'))
+            if (entry_extended_link):
+                a = entry_extended_link[0]
+                extended_url = (site + a['href']) if a['href'].startswith('/') else a['href']
+            
+            # process comments
+            comment_url = None
+            if (comments_beg >= 0):
+                comment_field = entry_footer_fields[comments_beg]
+                if (comment_field.string != 'Kommentare (0)'):
+                    # replace #comments with &serendipity[cview]=linear#comments
+                    # to get comments in a linear fashion that is hopefully easier to parse
+                    comment_url = site + str(comment_field['href'])
+                    comment_url = comment_url.replace('#comments', '&serendipity[cview]=linear#comments')
+            
+            # the entry page shows the extended body along with the comments,
+            # so a single download is enough for both
+            if (comment_url is not None):
+                if (extended_url is not None):
+                    crawl['saved'] += 1
+                entry['pending'] = True
+                crawl['crawler'].add(
+                    comment_url,
+                    lambda url, data, entry=entry, extended=(extended_url is not None): entryPageFetched(crawl, entry, url, data, extended, True)
+                    )
+            elif (extended_url is not None):
+                entry['pending'] = True
+                crawl['crawler'].add(
+                    extended_url,
+                    lambda url, data, entry=entry: entryPageFetched(crawl, entry, url, data, True, False)
+                    )
+    
+    # entries without pending downloads are complete right away
+    for entry in entries:
+        if (not entry['pending'] and not entry.get('skipped', False)):
+            finishEntry(crawl, entry)
+    
+    return entries
+
+def archivePageCount(content):
+    """Return the number of archive pages if shown, and the highest page linked to."""
+    
+    count = None
+    pagination = content.find(string=pagination_re)
+    if (pagination is not None):
+        count = int(pagination_re.search(pagination).group(2))
+    linked = [int(m.group(1)) for m in (page_link_re.search(a['href']) for a in content('a', href=True)) if m]
+    return count, max(linked, default=0)
+
+def queueArchivePage(crawl, page):
+    
+    crawl['crawler'].add(
+        crawl['archive_url'].format(page),
+        lambda url, data, page=page: archivePageFetched(crawl, page, data)
+        )
+
+def archivePageFetched(crawl, page, data):
+    
+    soup = parseArchivePage(data, crawl['parser'])
+    content = soup.find('td', id='content')
+    if (content is None or content.find('div', class_='serendipity_Entry_Date', recursive=False) is None):
+        # past the last page
+        discoverPages(crawl, page, False)
+        return
+    
+    crawl['pages'][page] = processArchivePage(crawl, soup, content)
+    count, linked = archivePageCount(content)
+    discoverPages(crawl, max(page, linked), True, count)
+
+def discoverPages(crawl, page, exists, count=None):
+    """Narrow down the number of archive pages, then queue all pages not fetched yet.
+    
+    The count is taken from the pagination footer if available. Otherwise, pages are probed
+    one at a time by doubling the page number until an empty page is found, then by bisection.
+    """
+    
+    d = crawl['discovery']
+    if (d['done']):
+        return
+    if (exists):
+        d['last'] = max(d['last'], page)
+    elif (d['empty'] is None or page < d['empty']):
+        d['empty'] = page
+    if (count is not None):
+        d['last'] = count
+        d['empty'] = count + 1
+    
+    limit = crawl['max_pages']
+    if (limit is not None and d['last'] >= limit):
+        if (d['last'] > limit):
+            print('Warning: only fetching the first {0:d} archive pages (sourceMaxPages).'.format(limit))
+        d['last'] = limit
+        d['empty'] = limit + 1
+    
+    if (d['empty'] is None or d['empty'] > d['last'] + 1):
+        if (d['empty'] is None):
+            probe = 2 * d['last']
+        else:
+            probe = (d['last'] + d['empty']) // 2
+        if (limit is not None):
+            probe = min(probe, limit)
+        d['probes'] += 1
+        queueArchivePage(crawl, probe)
+        return
+    
+    d['done'] = True
+    print('Found {0:d} archive pages ({1:d} probed).'.format(d['last'], d['probes']))
+    for p in range(1, d['last'] + 1):
+        if (p not in crawl['pages']):
+            queueArchivePage(crawl, p)
+
+def entryPageFetched(crawl, entry, url, data, extended, comments):
+    
+    subsoup = parseEntryPage(data, crawl['parser'])
+    if (extended):
+        processExtendedPage(entry, subsoup)
+    if (comments):
+        entry['comments'], comment_media = processCommentPage(url, subsoup)
+        if (comment_media):
+            print(f'Error: comment media unsupported for \'{url}\'.')
+    finishEntry(crawl, entry)
+
+def finishEntry(crawl, entry):
+    
+    # keep the position of images, so the transfer can put the uploaded files there
+    body, media = postProcessBody(entry['soup'], entry['body'], entry_rules, placeholders=True)
+    
+    entry['post'] = {
+        'date':       str(entry['date']),
+        'author':     entry['author'],
+        'author_id':  entry['author_id'],
+        'categories': [str(e) for e in entry['categories']],
+        'title':      str(entry['title']),
+        'content':    joinContent(body),
+        'comments':   entry['comments'],
+        'url':        entry['url'],
+        'media':      media,
+    }
+    # the page soup is no longer needed once the post is assembled
+    entry['soup'] = None
+    entry['body'] = None
+    
+    if (crawl['manifest'] is not None):
+        # write right away, so an interrupted scrape can be resumed
+        known = crawl['manifest'].get(entry['url'])
+        # a changed entry replaces its post
+        key = known['key'] if known is not None and 'key' in known else entryKey(entry['url'])
+        crawl['store'].write(key, entry['post'])
+        record = {'key': key, 'hash': entry['hash']}
+        if (media):
+            record['media'] = [[m['url'], m['filename']] for m in media]
+        crawl['manifest'][entry['url']] = record
+        appendManifest(crawl['directory'], entry['url'], record)
+        crawl['updated'] += 1
+    
+    # dump media files
+    for m in media:
+        queueMedia(crawl, m['url'], m['filename'])
+
+def queueMedia(crawl, link, filename):
+    
+    crawl['downloader'].add(
+        link,
+        (crawl['site'] + link) if link.startswith('/') else link,
+        filename
+        )
+
+def main():
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default='config.yml', help='configuration with sourceUrl and optional sourceMaxPages')
+    parser.add_argument('--max-transfers', type=int, default=4, help='number of concurrent transfers')
+    parser.add_argument('--max-downloads', type=int, default=4, help='number of concurrent media downloads')
+    parser.add_argument('--rate', type=float, default=None, help='maximum number of requests per second (default: unlimited)')
+    parser.add_argument('--retries', type=int, default=5, help='number of retries of failed or throttled requests')
+    parser.add_argument('--cache', default=None, help='directory for caching HTTP responses')
+    parser.add_argument('--offline', action='store_true', default=False, help='serve all requests from cache')
+    parser.add_argument('--parser', choices=sorted(parsers), default='lxml', help='HTML parsing backend')
+    parser.add_argument('--incremental', metavar='DIR', default=None, help='update an existing scrape, only fetching new or changed entries')
+    parser.add_argument('--format', choices=sorted(formats), default=None, help='storage format for posts (default: yaml, or the existing format with --incremental)')
+    
+    args = parser.parse_args()
+    
+    if (args.offline and args.cache is None):
+        print('Offline mode requires a cache directory.')
+        return -1
+    
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = yaml.load(f)
+    except Exception as e:
+        print('Could not load configuration \'{0:s}\'...'.format(args.config))
+        return -1
+    
+    if (not isinstance(config, dict) or 'sourceUrl' not in config):
+        print('Configuration file invalid, sourceUrl missing.')
+        return -1
+    
+    site = config['sourceUrl'].rstrip('/')
     author_url = '{0:s}/index.php?/authors/'.format(site)
     archive_url = '{0:s}/index.php?/archives/P{{0:d}}.html'.format(site)
     
-    # locale for date/time
-    # https://docs.microsoft.com/en-us/cpp/c-runtime-library/language-strings
-    locale.setlocale(locale.LC_ALL, 'american-english')
-    
     authors = {}
-    datetime.now()
     
-    directory = datetime.now().strftime('%Y%m%dT%H%M%S')
+    if (args.incremental is not None):
+        directory = args.incremental
+    else:
+        directory = datetime.now().strftime('%Y%m%dT%H%M%S')
     os.makedirs(directory, exist_ok=True)
     post_id = 0
     
-    for page in range(1, 8 + 1):
-    #for page in range(3, 8 + 1):
-        
-        buffer = BytesIO()
-        c = pycurl.Curl()
-        c.setopt(c.URL, archive_url.format(page))
-        c.setopt(c.WRITEDATA, buffer)
-        c.perform()
-        c.close()
-        
-        soup = BeautifulSoup(buffer.getvalue().decode('UTF-8'), 'lxml')
-        content = soup.find('td', id='content')
-        
-        for entry in content('div', class_='serendipity_Entry_Date', recursive=False):
+    if (args.format is None):
+        args.format = 'yaml' if args.incremental is None else detectFormat(directory)
+    
+    store = openStore(directory, args.format)
+    manifest = None
+    if (args.incremental is not None):
+        manifest = loadManifest(directory)
+        # posts named in crawl order by a scrape without --incremental would be kept next to the new ones
+        owned = {record.get('key') for record in manifest.values()}
+        foreign = [key for key in store.keys() if key not in owned]
+        if (foreign):
+            print('Error: {0:s} contains {1:d} posts not listed in manifest.yml (e.g. {2:s}), use --incremental with a new directory instead.'.format(directory, len(foreign), foreign[0]))
+            store.close()
+            return -1
+    
+    policy = RequestPolicy(args.max_transfers + args.max_downloads, rate=args.rate, retries=args.retries)
+    client = HttpClient(maxIdlePerHost=max(args.max_transfers, args.max_downloads), policy=policy)
+    cache = None if args.cache is None else HttpCache(args.cache, args.offline)
+    media = MediaStore(directory)
+    crawl = {
+        'site':        site,
+        'author_url':  author_url,
+        'archive_url': archive_url,
+        'max_pages':   config.get('sourceMaxPages'),
+        'discovery':   {'last': 0, 'empty': None, 'probes': 0, 'done': False},
+        'directory':   directory,
+        'store':       store,
+        'parser':      args.parser,
+        'manifest':    manifest,
+        'unchanged':   0,
+        'updated':     0,
+        'saved':       0,
+        'crawler':     Crawler(client, args.max_transfers, cache),
+        'downloader':  MediaDownloader(client, media, args.max_downloads, cache),
+        'pages':       {},
+    }
+    
+    # the first page tells how many pages there are
+    queueArchivePage(crawl, 1)
+    
+    try:
+        crawl['crawler'].run()
+        crawl['downloader'].wait()
+        media.linkNames()
+    except HttpCacheMiss as e:
+        print('Error: \'{0:s}\' is not cached, cannot continue offline.'.format(str(e)))
+        crawl['store'].close()
+        return -1
+    finally:
+        crawl['crawler'].close()
+        crawl['downloader'].close()
+        print('HTTP: {0:s}'.format(client.stats()))
+        print('Requests: {0:s}'.format(policy.stats()))
+        print('Media: {0:s}'.format(crawl['downloader'].stats()))
+        print('Media store: {0:s}'.format(media.stats()))
+        media.close()
+        print('Saved {0:d} requests by reading extended body and comments from the same page.'.format(crawl['saved']))
+        print('Styles: {0:s}'.format(inlineStyle.stats()))
+        if (cache is not None):
+            print('Cache: {0:s}'.format(cache.stats()))
+        client.close()
+    
+    # number posts and collect authors in archive order
+    pages = crawl['pages']
+    for page in sorted(pages):
+        for entry in pages[page]:
             
-            # extract date
-            date = entry('h3', class_='serendipity_date')
-            date = datetime.strptime(date[0].string, '%A, %d. %B %Y')
+            author_id = entry['author_id']
+            author = entry['author']
             
-            # FIXME: while loop here
-            for ix, title in enumerate(entry('h4', class_='serendipity_title')):
+            # add author to global list
+            # also check if duplicate author for whatever reason
+            if (author_id not in authors):
+                authors[author_id] = {'name': str(author), 'posts': 0}
             
-                # extract title
-                url = title.a['href']
-                title = title.a.string
-                
-                # body and footer
-                entry_contents = entry('div', class_='serendipity_entry')[ix]
-                entry_body = entry_contents('div', class_='serendipity_entry_body')[0]
-                entry_footer = entry_contents('div', class_='serendipity_entryFooter')[0]
-                
-                # check if extended entry and download content if so
-                entry_extended_link = entry_contents('a', href=lambda x: x.endswith('#extended'))
-                if (entry_extended_link):
-                    a = entry_extended_link[0]
-                    subbuffer = BytesIO()
-                    c = pycurl.Curl()
-                    c.setopt(c.URL, (site + a['href']) if a['href'].startswith('/') else a['href'])
-                    c.setopt(c.WRITEDATA, subbuffer)
-                    c.perform()
-                    c.close()
-                    
-                    subsoup = BeautifulSoup(subbuffer.getvalue().decode('UTF-8'), 'lxml')
-                    entry_contents = subsoup('div', class_='serendipity_entry')[0]
-                    entry_extended = entry_contents('div', class_='serendipity_entry_extended')[0]
-                    for c in entry_extended.children:
-                        if (c.name == 'a' and c.has_attr('id') and c['id'] == 'extended'):
-                            continue
-                        entry_body.append(copy(c))
-                
-                # extract author and time
-                entry_footer_fields = entry_footer.contents
-                entry_footer_strings = list(entry_footer.stripped_strings)
-                categories_beg = entry_footer_strings.index('in') + 1
-                time_beg = entry_footer_strings.index('um') + 1
-                comments_beg = -1 if '|' not in entry_footer_strings else entry_footer_strings.index('|') + 1
-                
-                # extract category (without commas)
-                categories = [str(e.string) for e in entry_footer_fields[categories_beg:time_beg - 1] if e.string != ', ']
-                
-                # extract time
-                time  = entry_footer_fields[time_beg].string
-                time = datetime.strptime(time, '%H:%M')
-                # figure out UTC offset
-                tz = getTimezone(date.date(), time.time())
-                date = datetime.combine(date.date(), time.time(), tz)
-                
-                # extract author ID and name
-                author_field = entry_footer_fields[1]
-                author_id = -1
-                author = author_field.string
-                if ('href' in author_field.attrs and author_field['href'].startswith(author_url)):
-                    author_string = author_field['href'][len(author_url):]
-                    # extract ID from 99-First-Last
-                    author_id = int(author_string.split('-', 1)[0])
-                else:
-                    print('Warning: Author {0:s} without ID in {1:s}!'.format(author, title))
-                
-                # add author to global list
-                # also check if duplicate author for whatever reason
-                if (author_id not in authors):
-                    authors[author_id] = {'name': str(author), 'posts': 0}
-                
-                authors[author_id]['posts'] += 1
-                
-                if (str(author) != authors[author_id]['name']):
-                    print('Error: Author {0:s} ({1:d}) name changed from {2:s}'.format(auhtor, author_id, authors[author_id]['name']))
-                
-                # process comments
-                comments = []
-                if (comments_beg >= 0):
-                    comment_field = entry_footer_fields[comments_beg]
-                    if (comment_field.string != 'Kommentare (0)'):
-                        # replace #comments with &serendipity[cview]=linear#comments
-                        # to get comments in a linear fashion that is hopefully easier to parse
-                        comment_url = site + str(comment_field['href'])
-                        comment_url = comment_url.replace('#comments', '&serendipity[cview]=linear#comments')
-                        comments, comment_media = processCommentPage(comment_url)
-                        if (comment_media):
-                            print(f'Error: comment media unsupported for \'{comment_url}\'.')
-                
-                body, media = postProcessBody(
-                    soup,
-                    entry_body,
-                    {'div': ['serendipity_authorpic']},
-                    {'p': ['style', 'class'], 'a': ['style', 'class']},
-                    {'address': [], 'br': [], 'font': [], 'pre': [], 'span': [], 'div': []},
-                    True
-                    )
-                
-                post = {
-                    'date':       str(date),
-                    'author':     str(author),
-                    'author_id':  author_id,
-                    'categories': [str(e) for e in categories],
-                    'title':      str(title),
-                    'content':    '\r\n'.join(filter(None, [str(e).strip() for e in body.contents])),
-                    'comments':   comments,
-                    'url':        (site + url) if url.startswith('/') else url,
-                    'media':      media,
-                }
-                
-                # dump media files
-                for m in media:
-                    with open(os.path.join(directory, m['filename']), 'wb') as mediafile:
-                        filename = m['filename']
-                        print(f'Collecting media file \'{filename}\'...')
-                        c = pycurl.Curl()
-                        c.setopt(c.URL, (site + m['url']) if m['url'].startswith('/') else m['url'])
-                        c.setopt(c.WRITEDATA, mediafile)
-                        c.perform()
-                        c.close()
-                
-                post_data = yaml.dump(post, encoding='utf-8', allow_unicode=True, default_flow_style=False)
-                with open(directory + '/{0:03d}.yml'.format(post_id), 'bw') as f:
-                    f.write(post_data)
-                #code.interact(local=locals())
-                post_id += 1
+            authors[author_id]['posts'] += 1
+            
+            if (str(author) != authors[author_id]['name']):
+                print('Error: Author {0:s} ({1:d}) name changed from {2:s}'.format(author, author_id, authors[author_id]['name']))
+            
+            if (crawl['manifest'] is not None):
+                # already written by entry id
+                continue
+            
+            crawl['store'].write('{0:03d}'.format(post_id), entry['post'])
+            post_id += 1
+    crawl['store'].close()
+    
+    if (crawl['manifest'] is not None):
+        writeManifest(directory, crawl['manifest'])
+        print('Incremental: {0:d} entries unchanged, {1:d} new or changed.'.format(crawl['unchanged'], crawl['updated']))
+        # keep manually added fields, e.g. the Wordpress slug
+        if (os.path.exists(directory + '/authors.yml')):
+            with open(directory + '/authors.yml', 'r', encoding='utf-8') as f:
+                previous_authors = yaml.load(f) or {}
+            for k, v in authors.items():
+                for field, value in previous_authors.get(k, {}).items():
+                    v.setdefault(field, value)
     
     author_data = yaml.dump(authors, encoding='utf-8', allow_unicode=True, default_flow_style=False)
     with open(directory + '/authors.yml', 'bw') as f:
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import re
+
+# <p>\s*</p> --> kill, &nbsp; --> kill
+empty_re = re.compile(r'<p>\s*</p>|\xA0')
+
+# [word]\r\n<a ...</a>\r\n[word] --> [word] <a ...</a> [word]
+# </a>\r\n[.:,] --> </a>[.:,]
+# matches always end after a whole word, so starting at the beginning of a word only is the same as starting anywhere
+link_re = re.compile(r'(?<!\w)(\w+)\r\n<a(.*)</a>\r\n(\w+)|</a>\r\n([.:,])')
+
+# \space+[word]+\space*\r\n[word]+\space --> \space+[word]+ [word]+\space
+# \space+[word]+\r\n\space*[word]+\space --> \space+[word]+ [word]+\space
+# \space+-\r\n\space+[word]+ --> \space+-\space+[word]+
+# Candidates are found at every position (overlapping) using lookaheads, groups are (line break, rest of match).
+word_before_re = re.compile(r'(?<=\s)(?=[,.:\w\-\(\)]+(\s*\r\n)(?!\d)([.,:\w\-\(\)]+)\s)')
+word_after_re = re.compile(r'(?<=\s)(?=[,.:\w\-\(\)]+(\r\n\s*)(?!\d)([.,:\w\-\(\)]+)\s)')
+dash_re = re.compile(r'(?<=\s)(?=-(\r\n)\s+([.,\w\-\(\)]+))')
+
+# link targets and image sources, content is serialized by BeautifulSoup and always uses double quotes
+link_attr_re = re.compile(r'(\b(?:href|src)=")([^"]*)"')
+origin_re = re.compile(r'^[A-Za-z][A-Za-z0-9+.\-]*://[^/"]*')
+
+# images stripped when scraping are marked as <!--media:N-->, N being the index in the media of the post
+media_placeholder = 'media:{0:d}'
+media_placeholder_re = re.compile(r'<!--media:(\d+)-->')
+
+def _joinLines(candidates, content, replacement, trailing):
+    """Replace the line break of non-overlapping candidates from left to right.
+    
+    A candidate is only used if some of the whitespace in front of it was not taken by the previous match,
+    which ends trailing characters after the rest group.
+    """
+    
+    parts = []
+    copied = 0
+    end = 0
+    for m in candidates.finditer(content):
+        if (m.start() <= end):
+            continue
+        parts.append(content[copied:m.start(1)])
+        parts.append(replacement)
+        copied = m.end(1)
+        end = m.end(2) + trailing
+    if (not parts):
+        return content
+    parts.append(content[copied:])
+    return ''.join(parts)
+
+def _link(m):
+    
+    if (m.group(4) is not None):
+        return '</a>' + m.group(4)
+    return '{0:s} <a{1:s}</a> {2:s}'.format(m.group(1), m.group(2), m.group(3))
+
+def reworkContent(content):
+    """Join lines broken by serendipity's editor and drop empty paragraphs and non-breaking spaces.
+    
+    Output is identical to applying the rules one after the other using re.sub, see benchmark.py content.
+    Every rule runs in linear time, rules that cannot create matches for each other share a scan.
+    """
+    
+    content = content.replace('\r\n<br/>\r\n', '\r\n')
+    content = empty_re.sub('', content)
+    content = link_re.sub(_link, content)
+    content = _joinLines(word_before_re, content, ' ', 1)
+    content = _joinLines(word_after_re, content, ' ', 1)
+    content = _joinLines(dash_re, content, '', 0)
+    return content
+
+def rewriteLinks(content, urls):
+    """Point links and images at new URLs, urls maps old URLs (absolute or relative to the old site) to new ones."""
+    
+    def rewrite(m):
+        url = m.group(2)
+        new = urls.get(url)
+        if (new is None):
+            new = urls.get(origin_re.sub('', url), url)
+        return m.group(1) + new + '"'
+    
+    return link_attr_re.sub(rewrite, content)
+
+def placeMedia(content, images):
+    """Replace media placeholders by images, a list of markup per media index (None drops the placeholder).
+    
+    Returns the content and the set of indices placed, scrapes made before placeholders existed have none.
+    """
+    
+    placed = set()
+    
+    def replace(m):
+        ix = int(m.group(1))
+        if (ix >= len(images) or images[ix] is None):
+            return ''
+        placed.add(ix)
+        return images[ix]
+    
+    return media_placeholder_re.sub(replace, content), placed
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from storage import openStore
+
+def _loadChunk(directory, format, keys):
+    
+    with openStore(directory, format) as store:
+        return [(key, store.load(key)) for key in keys]
+
+def loadPosts(store, keys=None, workers=None, chunkSize=16):
+    """Yield (key, post) for keys (default: all posts) of store in key order.
+    
+    YAML posts are parsed by a pool of worker processes (default: one per CPU) in chunks of chunkSize posts.
+    At most two chunks per worker are in flight, so memory stays bounded if the caller consumes posts slowly.
+    Other formats are cheap to decode and are loaded in this process.
+    """
+    
+    if (workers is None):
+        workers = os.cpu_count() or 1
+    if (not store.parallel or workers <= 1):
+        if (keys is None):
+            yield from store.items()
+        else:
+            for key in sorted(keys):
+                yield key, store.load(key)
+        return
+    
+    keys = store.keys() if keys is None else sorted(keys)
+    if (len(keys) <= chunkSize):
+        for key in keys:
+            yield key, store.load(key)
+        return
+    
+    chunks = iter([keys[i:i + chunkSize] for i in range(0, len(keys), chunkSize)])
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_loadChunk, store.directory, store.format, chunk))
+            if (len(pending) >= 2 * workers):
+                break
+        while (pending):
+            posts = pending.popleft().result()
+            chunk = next(chunks, None)
+            if (chunk is not None):
+                pending.append(pool.submit(_loadChunk, store.directory, store.format, chunk))
+            yield from posts
+
+def streamPosts(directory, workers=None):
+    """Yield (key, post) of all posts in directory, see loadPosts."""
+    
+    with openStore(directory) as store:
+        yield from loadPosts(store, workers=workers)
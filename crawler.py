@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import heapq
+import itertools
+import pycurl
+import time
+from collections import deque
+
+class Crawler:
+    """Run queued GET requests on a CurlMulti with a bounded number of transfers in flight.
+    
+    Callbacks are invoked as callback(url, data) once a transfer finished and may queue further requests.
+    Handles are taken from and returned to the HttpClient pool, so connections are kept alive.
+    If an HttpCache is given, cached responses are revalidated or, if offline, served without any transfer.
+    If the client has a RequestPolicy, transfers are started as it allows and failed transfers are queued again after a delay.
+    """
+    
+    def __init__(self, client, maxTransfers=4, cache=None):
+        self._client = client
+        self._policy = client.policy
+        self._cache = cache
+        self._maxTransfers = max(1, maxTransfers)
+        self._multi = pycurl.CurlMulti()
+        self._queue = deque()
+        self._active = {}
+        # retries as (due, sequence, url, callback, attempt)
+        self._delayed = []
+        self._sequence = itertools.count()
+    
+    def add(self, url, callback):
+        self._queue.append((url, callback, 0))
+    
+    def _start(self, url, callback, attempt):
+        
+        headers = None
+        if (self._cache is not None):
+            headers = self._cache.conditionalHeaders(url)
+        
+        c = self._client.acquire(url)
+        response = self._client.prepare(c, 'GET', url, headers)
+        self._multi.add_handle(c)
+        self._active[c] = (url, callback, response, attempt)
+    
+    def _retry(self, url, callback, attempt, delay):
+        heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), url, callback, attempt + 1))
+    
+    def _finish(self, c):
+        
+        url, callback, response, attempt = self._active.pop(c)
+        self._multi.remove_handle(c)
+        self._client.complete(c, response)
+        self._client.release(c)
+        if (self._policy is not None):
+            delay = self._policy.end(url, 'GET', attempt, response=response)
+            if (delay is not None):
+                self._retry(url, callback, attempt, delay)
+                return
+        if (self._cache is not None):
+            callback(url, self._cache.update(url, response))
+        else:
+            callback(url, response.body)
+    
+    def _fail(self, c, errno, errmsg):
+        
+        url, callback, response, attempt = self._active.pop(c)
+        self._multi.remove_handle(c)
+        c.close()
+        error = pycurl.error(errno, errmsg)
+        if (self._policy is not None):
+            delay = self._policy.end(url, 'GET', attempt, error=error)
+            if (delay is not None):
+                self._retry(url, callback, attempt, delay)
+                return
+        # behave like Curl.perform() would in a serial run
+        raise error
+    
+    def run(self):
+        
+        while (self._queue or self._active or self._delayed):
+            
+            # retries are due before anything queued later
+            while (self._delayed and self._delayed[0][0] <= time.monotonic()):
+                due, sequence, url, callback, attempt = heapq.heappop(self._delayed)
+                self._queue.appendleft((url, callback, attempt))
+            
+            # seconds until the policy allows the next transfer
+            wait = None
+            while (self._queue and len(self._active) < self._maxTransfers):
+                url, callback, attempt = self._queue[0]
+                if (self._cache is not None and self._cache.offline):
+                    self._queue.popleft()
+                    callback(url, self._cache.get(url))
+                    continue
+                if (self._policy is not None):
+                    wait = self._policy.wait(url)
+                    if (wait > 0):
+                        break
+                    self._policy.start(url)
+                self._queue.popleft()
+                self._start(url, callback, attempt)
+            
+            timeout = 1.0 if self._active else 0.1
+            if (wait is not None):
+                timeout = min(timeout, wait)
+            if (self._delayed):
+                timeout = max(0.0, min(timeout, self._delayed[0][0] - time.monotonic()))
+            if (not self._active):
+                # nothing to wait for but time, e.g. a retry or a rate limit
+                time.sleep(timeout)
+                continue
+            
+            while True:
+                ret, num_handles = self._multi.perform()
+                if (ret != pycurl.E_CALL_MULTI_PERFORM):
+                    break
+            
+            done = False
+            while True:
+                num_queued, ok_list, err_list = self._multi.info_read()
+                for c in ok_list:
+                    self._finish(c)
+                    done = True
+                for c, errno, errmsg in err_list:
+                    self._fail(c, errno, errmsg)
+                if (num_queued == 0):
+                    break
+            
+            if (not done and self._active):
+                self._multi.select(timeout)
+    
+    def close(self):
+        
+        for c in list(self._active):
+            self._multi.remove_handle(c)
+            c.close()
+        self._active.clear()
+        self._queue.clear()
+        self._multi.close()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import json
+import os
+import shutil
+import threading
+from hashlib import sha1, sha256
+from urllib.parse import urldefrag
+
+class HttpCacheMiss(Exception):
+    pass
+
+class HttpCache:
+    """On-disk response cache.
+    
+    Response metadata is stored per URL in urls/, bodies are stored by content hash in objects/.
+    Cached responses are revalidated using If-None-Match/If-Modified-Since unless offline.
+    """
+    
+    def __init__(self, directory, offline=False):
+        self._directory = directory
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _key(url):
+        # fragments are never sent to the server
+        return sha1(urldefrag(url)[0].encode('utf-8')).hexdigest()
+    
+    def _metaPath(self, url):
+        key = HttpCache._key(url)
+        return os.path.join(self._directory, 'urls', key[:2], key + '.json')
+    
+    def _objectPath(self, digest):
+        return os.path.join(self._directory, 'objects', digest[:2], digest)
+    
+    @staticmethod
+    def _write(path, data):
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    
+    def lookup(self, url):
+        
+        try:
+            with open(self._metaPath(url), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def load(self, url, meta=None):
+        """Return cached body for url or raise HttpCacheMiss."""
+        
+        if (meta is None):
+            meta = self.lookup(url)
+        if (meta is None):
+            self.misses += 1
+            raise HttpCacheMiss(url)
+        try:
+            with open(self._objectPath(meta['sha256']), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            raise HttpCacheMiss(url)
+    
+    def store(self, url, response):
+        
+        body = response.body
+        digest = sha256(body).hexdigest()
+        path = self._objectPath(digest)
+        if (not os.path.exists(path)):
+            HttpCache._write(path, body)
+        self._storeMeta(url, digest, response)
+    
+    def storeFile(self, url, filename, response):
+        """Like update() for a fresh response whose body was written to filename instead of memory, e.g. a download."""
+        
+        digest = sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        path = self._objectPath(digest)
+        if (not os.path.exists(path)):
+            # downloads of identical files may be stored at the same time
+            tmp = '{0:s}.{1:d}.tmp'.format(path, threading.get_ident())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(filename, tmp)
+            os.replace(tmp, path)
+        self._storeMeta(url, digest, response)
+        self.misses += 1
+    
+    def _storeMeta(self, url, digest, response):
+        
+        meta = {
+            'url':           urldefrag(url)[0],
+            'sha256':        digest,
+            'etag':          response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+        }
+        HttpCache._write(self._metaPath(url), json.dumps(meta).encode('utf-8'))
+    
+    def entries(self):
+        """Iterate over (url, metadata) of all cached responses."""
+        
+        top = os.path.join(self._directory, 'urls')
+        if (not os.path.isdir(top)):
+            return
+        for sub in sorted(os.listdir(top)):
+            for name in sorted(os.listdir(os.path.join(top, sub))):
+                if (not name.endswith('.json')):
+                    continue
+                with open(os.path.join(top, sub, name), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                yield meta['url'], meta
+    
+    def conditionalHeaders(self, url):
+        
+        meta = self.lookup(url)
+        headers = []
+        # only revalidate if the body is still around
+        if (meta is not None and os.path.exists(self._objectPath(meta['sha256']))):
+            if (meta['etag']):
+                headers.append('If-None-Match: ' + meta['etag'])
+            if (meta['last_modified']):
+                headers.append('If-Modified-Since: ' + meta['last_modified'])
+        return headers
+    
+    def get(self, url):
+        """Serve url from cache without network access."""
+        
+        body = self.load(url)
+        self.hits += 1
+        return body
+    
+    def update(self, url, response):
+        """Store a fresh response or resolve a 304 from cache, returning the body."""
+        
+        if (response.status == 304):
+            body = self.load(url)
+            self.revalidated += 1
+            return body
+        if (response.status == 200):
+            self.store(url, response)
+        self.misses += 1
+        return response.body
+    
+    def stats(self):
+        return '{0:d} hits, {1:d} revalidated, {2:d} misses'.format(self.hits, self.revalidated, self.misses)
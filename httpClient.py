@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import certifi
+import os
+import pycurl
+import threading
+import time
+from io import BytesIO
+from urllib.parse import urlsplit
+
+class Response:
+    
+    def __init__(self, method, url):
+        self.method = method
+        self.url = url
+        self.status = None
+        self.time = None
+        self.latency = None
+        self.headers = {}
+        self._buffer = BytesIO()
+    
+    @property
+    def body(self):
+        return self._buffer.getvalue()
+    
+    def _header(self, line):
+        line = line.decode('iso-8859-1').rstrip('\r\n')
+        if (line.startswith('HTTP/')):
+            # new response, e.g. after 100 Continue
+            self.status = int(line.split()[1])
+            self.headers = {}
+        elif (':' in line):
+            name, value = line.split(':', 1)
+            self.headers[name.strip().lower()] = value.strip()
+
+class HttpClient:
+    """Pool of keep-alive pycurl handles per host sharing DNS, TLS session and connection caches.
+    
+    If a RequestPolicy is given, requests are rate limited and transient failures are retried.
+    """
+    
+    def __init__(self, maxIdlePerHost=8, caInfo=None, policy=None):
+        self.policy = policy
+        self._maxIdlePerHost = maxIdlePerHost
+        self._caInfo = certifi.where() if caInfo is None else caInfo
+        self._share = pycurl.CurlShare()
+        self._share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+        self._share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_SSL_SESSION)
+        if (hasattr(pycurl, 'LOCK_DATA_CONNECT')):
+            self._share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_CONNECT)
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connects = 0
+        self.reused = 0
+    
+    @staticmethod
+    def _host(url):
+        parts = urlsplit(url)
+        return '{0:s}://{1:s}'.format(parts.scheme, parts.netloc)
+    
+    def acquire(self, url):
+        """Get an idle handle for the host of url or a new one."""
+        
+        host = HttpClient._host(url)
+        with self._lock:
+            handles = self._idle.get(host, [])
+            c = handles.pop() if handles else None
+        
+        if (c is None):
+            c = pycurl.Curl()
+            c.host = host
+            c.setopt(c.SHARE, self._share)
+        else:
+            # keeps connection and share, but drops all other options
+            c.reset()
+        c.setopt(c.CAINFO, self._caInfo)
+        return c
+    
+    def release(self, c):
+        """Return a handle to the pool, keeping its connection alive."""
+        
+        with self._lock:
+            handles = self._idle.setdefault(c.host, [])
+            if (len(handles) < self._maxIdlePerHost):
+                handles.append(c)
+                return
+        c.close()
+    
+    def prepare(self, c, method, url, headers=None, body=None):
+        """Configure handle c for a request and return the Response to be filled in.
+        
+        body may also be a file opened in binary mode, which is then streamed instead of read into memory.
+        """
+        
+        response = Response(method, url)
+        c.setopt(c.URL, url)
+        c.setopt(c.WRITEDATA, response._buffer)
+        c.setopt(c.HEADERFUNCTION, response._header)
+        if (headers):
+            c.setopt(c.HTTPHEADER, headers)
+        if (hasattr(body, 'read')):
+            c.setopt(c.READFUNCTION, body.read)
+            c.setopt(c.POSTFIELDSIZE_LARGE, os.fstat(body.fileno()).st_size - body.tell())
+        elif (body is not None):
+            c.setopt(c.POSTFIELDS, body)
+        if (method == 'POST'):
+            c.setopt(c.POST, True)
+        elif (method != 'GET'):
+            c.setopt(c.CUSTOMREQUEST, method)
+        if (self.policy is not None):
+            self.policy.configure(c)
+        return response
+    
+    def complete(self, c, response):
+        """Record status and connection statistics after a transfer finished."""
+        
+        response.status = c.getinfo(c.RESPONSE_CODE)
+        response.time = c.getinfo(c.TOTAL_TIME)
+        # time the server took to answer
+        response.latency = c.getinfo(c.STARTTRANSFER_TIME) - c.getinfo(c.PRETRANSFER_TIME)
+        connects = c.getinfo(c.NUM_CONNECTS)
+        with self._lock:
+            self.requests += 1
+            self.connects += connects
+            if (connects == 0):
+                self.reused += 1
+        return response
+    
+    def perform(self, c, response, attempt=0):
+        """Run a transfer prepared on c, returning the number of seconds to wait before retrying it or None.
+        
+        c is released afterwards or closed if the transfer failed.
+        Errors are raised like Curl.perform() does unless the policy retries them.
+        """
+        
+        if (self.policy is not None):
+            self.policy.begin(response.url)
+        try:
+            c.perform()
+        except pycurl.error as e:
+            c.close()
+            if (self.policy is None):
+                raise
+            delay = self.policy.end(response.url, response.method, attempt, error=e)
+            if (delay is None):
+                raise
+            return delay
+        except:
+            c.close()
+            if (self.policy is not None):
+                self.policy.end(response.url, response.method, attempt, error=pycurl.error(pycurl.E_ABORTED_BY_CALLBACK))
+            raise
+        self.complete(c, response)
+        self.release(c)
+        if (self.policy is None):
+            return None
+        return self.policy.end(response.url, response.method, attempt, response=response)
+    
+    def request(self, method, url, headers=None, body=None):
+        """Send a request and return its Response.
+        
+        headers may also be a function returning them, which is called for every attempt, e.g. to sign each of them.
+        """
+        
+        offset = body.tell() if hasattr(body, 'seek') else None
+        attempt = 0
+        while True:
+            c = self.acquire(url)
+            try:
+                if (offset is not None):
+                    body.seek(offset)
+                response = self.prepare(c, method, url, headers() if callable(headers) else headers, body)
+            except:
+                c.close()
+                raise
+            delay = self.perform(c, response, attempt)
+            if (delay is None):
+                return response
+            time.sleep(delay)
+            attempt += 1
+    
+    def stats(self):
+        return '{0:d} requests, {1:d} connections opened, {2:d} reused'.format(self.requests, self.connects, self.reused)
+    
+    def close(self):
+        
+        with self._lock:
+            for handles in self._idle.values():
+                for c in handles:
+                    c.close()
+            self._idle.clear()
+        self._share.close()
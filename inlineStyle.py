@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+from functools import lru_cache
+
+# legacy content repeats the same few style strings over and over,
+# so every distinct string is only parsed once
+cache_size = 4096
+
+@lru_cache(maxsize=cache_size)
+def parseStyle(style):
+    """Parse an inline style attribute into a tuple of normalized (property, value) declarations.
+    
+    Whitespace is removed from property names and collapsed to a single space in values,
+    e.g. 'font-weight : bold ; margin:0cm  0pt' --> (('font-weight', 'bold'), ('margin', '0cm 0pt')).
+    """
+    
+    declarations = []
+    for part in style.split(';'):
+        if (':' not in part):
+            continue
+        name, value = part.split(':', 1)
+        name = ''.join(name.split())
+        if (name):
+            declarations.append((name, ' '.join(value.split())))
+    return tuple(declarations)
+
+@lru_cache(maxsize=cache_size)
+def styleDict(style):
+    """Declarations of an inline style as dict (later declarations win). Do not modify the result."""
+    return dict(parseStyle(style))
+
+def isBold(style):
+    """Any font-weight declaration being bold counts, even if a later one overrides it."""
+    return any(name == 'font-weight' and value.replace(' ', '') == 'bold' for name, value in parseStyle(style))
+
+def isMarginBreak(style):
+    """Word uses paragraphs with zero margin for simple line breaks."""
+    return parseStyle(style) == (('margin', '0cm 0cm 0pt'),)
+
+def stats():
+    
+    parsed = parseStyle.cache_info()
+    hits = parsed.hits + styleDict.cache_info().hits
+    return '{0:d} distinct styles parsed, {1:d} lookups served from cache'.format(parsed.misses, hits)
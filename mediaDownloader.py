@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import os
+import pycurl
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from httpCache import HttpCacheMiss
+
+# e.g. 'bytes 100-199/200' or 'bytes */200'
+content_range_re = re.compile(r'bytes (?:\d+-\d+|\*)/(\d+)')
+
+class MediaDownloadError(Exception):
+    pass
+
+class MediaDownloader:
+    """Download media files into a MediaStore on worker threads, so they do not hold up fetching and parsing pages.
+    
+    Links already in the store are not downloaded again.
+    Files are written to a .part file first and only renamed once their size matches Content-Length (or Content-Range).
+    A .part file left behind by an interrupted run (or a failed attempt retried by the RequestPolicy of the client) is continued using a Range request.
+    If an HttpCache is given, downloads are revalidated against and stored in the cache, or served from it if offline.
+    """
+    
+    def __init__(self, client, store, workers=4, cache=None):
+        self._client = client
+        self._store = store
+        self._cache = cache
+        self._pool = ThreadPoolExecutor(max(1, workers))
+        self._futures = []
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.downloaded = 0
+        self.skipped = 0
+        self.resumed = 0
+        self.failed = 0
+        self.bytes = 0
+    
+    def add(self, link, url, filename):
+        """Queue a download of url, link is the URL as found in posts."""
+        
+        with self._lock:
+            # a file linked from several posts is only downloaded once
+            if (link in self._pending or link in self._store):
+                self.skipped += 1
+                return
+            self._pending.add(link)
+        self._futures.append(self._pool.submit(self._run, link, url, filename))
+    
+    def _run(self, link, url, filename):
+        
+        try:
+            attempt = 0
+            while True:
+                delay = self._download(link, url, filename, attempt)
+                if (delay is None):
+                    break
+                time.sleep(delay)
+                attempt += 1
+        except (pycurl.error, MediaDownloadError, HttpCacheMiss, OSError) as e:
+            print('Error: downloading media file \'{0:s}\' from \'{1:s}\' failed: {2!s}'.format(filename, url, e))
+            with self._lock:
+                self.failed += 1
+        with self._lock:
+            self._pending.discard(link)
+    
+    def _download(self, link, url, filename, attempt=0):
+        """Download url into the store, returning the number of seconds to wait before retrying or None once done."""
+        
+        part = self._store.partPath(sha1(url.encode('utf-8')).hexdigest())
+        
+        if (self._cache is not None and self._cache.offline):
+            data = self._cache.get(url)
+            with open(part, 'wb') as f:
+                f.write(data)
+            self._finish(link, filename, part, 0, False)
+            return
+        
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if (offset > 0):
+            headers = ['Range: bytes={0:d}-'.format(offset)]
+        elif (self._cache is not None):
+            headers = self._cache.conditionalHeaders(url)
+        else:
+            headers = []
+        
+        c = self._client.acquire(url)
+        try:
+            response = self._client.prepare(c, 'GET', url, headers)
+            f = open(part, 'ab')
+        except:
+            c.close()
+            raise
+        with f:
+            
+            def write(data):
+                nonlocal offset
+                # status as of the status line, the transfer is still running
+                if (response.status == 200 and offset > 0):
+                    # Range not supported, start over
+                    f.truncate(0)
+                    offset = 0
+                if (response.status in (200, 206)):
+                    f.write(data)
+                else:
+                    response._buffer.write(data)
+            
+            c.setopt(c.WRITEFUNCTION, write)
+            # keeps whatever arrived for the next attempt or run
+            delay = self._client.perform(c, response, attempt)
+        if (delay is not None):
+            return delay
+        
+        size = os.path.getsize(part)
+        if (response.status == 304):
+            data = self._cache.update(url, response)
+            with open(part, 'wb') as f:
+                f.write(data)
+            self._finish(link, filename, part, 0, False)
+            return
+        
+        if (response.status == 416):
+            # the previous run got everything but could not rename
+            m = content_range_re.match(response.headers.get('content-range', ''))
+            if (m is not None and int(m.group(1)) == size):
+                self._finish(link, filename, part, 0, True)
+                return
+            os.remove(part)
+            raise MediaDownloadError('requested range not satisfiable, starting over next time')
+        
+        if (response.status not in (200, 206)):
+            raise MediaDownloadError('HTTP status {0:d}'.format(response.status))
+        
+        expected = None
+        if (response.status == 206):
+            m = content_range_re.match(response.headers.get('content-range', ''))
+            if (m is not None):
+                expected = int(m.group(1))
+        elif ('content-length' in response.headers):
+            expected = int(response.headers['content-length'])
+        if (expected is not None and size != expected):
+            if (size > expected):
+                os.remove(part)
+            raise MediaDownloadError('got {0:d} of {1:d} bytes'.format(size, expected))
+        
+        if (self._cache is not None):
+            self._cache.storeFile(url, part, response)
+        self._finish(link, filename, part, size - (offset if response.status == 206 else 0), response.status == 206)
+    
+    def _finish(self, link, filename, part, transferred, resumed):
+        
+        self._store.add(link, filename, part)
+        with self._lock:
+            self.downloaded += 1
+            self.resumed += resumed
+            self.bytes += transferred
+        print('Collecting media file \'{0:s}\'...'.format(filename))
+    
+    def wait(self):
+        """Wait for all queued downloads, returning the number of failed ones."""
+        
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        return self.failed
+    
+    def stats(self):
+        return '{0:d} files, {1:d} already fetched, {2:d} resumed, {3:d} failed, {4:.1f} KiB transferred'.format(
+            self.downloaded, self.skipped, self.resumed, self.failed, self.bytes / 1024
+        )
+    
+    def close(self):
+        self._pool.shutdown()
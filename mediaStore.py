@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import os
+import shutil
+import sqlite3
+import threading
+from hashlib import sha256
+
+schema = '''
+CREATE TABLE IF NOT EXISTS media (
+    link     TEXT PRIMARY KEY,
+    sha256   TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_sha256 ON media(sha256);
+'''
+
+class MediaStore:
+    """Content-addressed store of the media files of a scrape directory.
+    
+    Every distinct file is kept once in media/ named by its SHA-256, an index maps the links found in posts to their file.
+    linkNames() makes the files available under their original names in the scrape directory using hardlinks.
+    Can be shared between threads.
+    """
+    
+    directory = 'media'
+    filename = 'index.sqlite'
+    
+    def __init__(self, directory):
+        self._directory = directory
+        self._media = os.path.join(directory, MediaStore.directory)
+        os.makedirs(self._media, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self._media, MediaStore.filename), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(schema)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def __contains__(self, link):
+        return self.get(link) is not None
+    
+    def get(self, link):
+        """Return (sha256, filename, size) of a stored link or None."""
+        
+        with self._lock:
+            row = self._db.execute('SELECT sha256, filename, size FROM media WHERE link = ?', (link,)).fetchone()
+        if (row is None or not os.path.exists(self.path(row[0]))):
+            return None
+        return row
+    
+    def path(self, digest):
+        return os.path.join(self._media, digest[:2], digest)
+    
+    def partPath(self, name):
+        """Return a path for incomplete files in the store, e.g. downloads."""
+        return os.path.join(self._media, name + '.part')
+    
+    def add(self, link, filename, path, keep=False):
+        """Store the file at path for link, moving it into the store unless keep is set, and return its SHA-256."""
+        
+        digest = sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        size = os.path.getsize(path)
+        
+        target = self.path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with self._lock:
+            if (os.path.exists(target)):
+                if (not keep):
+                    os.remove(path)
+            elif (keep):
+                MediaStore._link(path, target)
+            else:
+                os.replace(path, target)
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO media (link, sha256, filename, size) VALUES (?, ?, ?, ?)', (link, digest, filename, size))
+        return digest
+    
+    @staticmethod
+    def _link(source, target):
+        
+        tmp = '{0:s}.{1:d}.tmp'.format(target, threading.get_ident())
+        try:
+            os.link(source, tmp)
+        except OSError:
+            # e.g. across file systems
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    
+    def links(self):
+        """Return {link: (sha256, filename)} of all stored links."""
+        
+        with self._lock:
+            rows = self._db.execute('SELECT link, sha256, filename FROM media').fetchall()
+        return {link: (digest, filename) for link, digest, filename in rows}
+    
+    def linkNames(self):
+        """Hardlink every file into the scrape directory under its original name, returning {name: sha256}.
+        
+        Names are assigned in order of the links, so the result does not depend on the order of downloads.
+        Different files of the same name get the start of their hash appended, e.g. image-0123abcd.jpg.
+        """
+        
+        with self._lock:
+            rows = self._db.execute('SELECT sha256, filename FROM media ORDER BY link').fetchall()
+        names = {}
+        for digest, filename in rows:
+            name = filename
+            if (names.get(name, digest) != digest):
+                stem, ext = os.path.splitext(filename)
+                name = '{0:s}-{1:s}{2:s}'.format(stem, digest[:8], ext)
+            names[name] = digest
+        
+        for name, digest in names.items():
+            target = os.path.join(self._directory, name)
+            if (not os.path.exists(target) or not os.path.samefile(target, self.path(digest))):
+                MediaStore._link(self.path(digest), target)
+        return names
+    
+    def stats(self):
+        
+        with self._lock:
+            links, referenced = self._db.execute('SELECT COUNT(*), TOTAL(size) FROM media').fetchone()
+            files, stored = self._db.execute('SELECT COUNT(*), TOTAL(size) FROM (SELECT DISTINCT sha256, size FROM media)').fetchone()
+        return '{0:d} links, {1:d} distinct files ({2:.2f} links per file), {3:.1f} KiB stored, {4:.1f} KiB saved by deduplication'.format(
+            links, files, links / files if files else 0, stored / 1024, (referenced - stored) / 1024
+        )
+    
+    def close(self):
+        self._db.close()
@@ -5,21 +5,34 @@ __author__ = "Robert Abel"
 __copyright__ = "Copyright (c) 2018–2019"
 __license__ = "MIT"
 
-import certifi
 import os
 import sys
 import argparse
 import hmac
 import json
 import locale
+import mimetypes
 import pycurl
-import random
 import re
+import secrets
+import threading
+import time
+import unicodedata
 import yaml
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from base64 import b64encode
 from datetime import datetime, timezone
-from io import BytesIO
+from functools import lru_cache
 from hashlib import sha1
+from httpClient import HttpClient
+from requestPolicy import RequestPolicy
+from contentTransform import reworkContent, rewriteLinks, placeMedia
+from corpus import streamPosts
+from mediaStore import MediaStore
+from postIndex import PostIndex
+from storage import openStore
+from transferJournal import TransferJournal
 from urllib.parse import urlencode, quote, parse_qs
 
 posts_ep = '/wp/v2/posts'
@@ -28,70 +41,86 @@ tags_ep = '/wp/v2/tags'
 comments_ep = '/wp/v2/comments'
 media_ep = '/wp/v2/media'
 users_ep = '/wp/v2/users'
+batch_ep = '/batch/v1'
 
-def generate_nonce(length=8):
-    """Generate pseudorandom number."""
-    return ''.join([str(random.randint(0, 9)) for i in range(length)])
+# link to an uploaded image, formatted with its URL and ID
+image_markup = '<a href="{0:s}"><img class="wp-image-{1:d}" src="{0:s}" alt="" /></a>'
+
+# threads retrieving further pages of a collection
+page_workers = 4
+
+def generate_nonce(length=16):
+    """Generate a random nonce of 2 * length hex digits, unique even at high request rates."""
+    return secrets.token_hex(length)
+
+# characters left as they are by OAuth 1.0a (unreserved characters of RFC 3986)
+unreserved = '-._~'
+
+@lru_cache(maxsize=4096)
+def percentEncode(s):
+    """Percent-encode everything but unreserved characters (RFC 3986) as required by OAuth 1.0a.
+    
+    Cached for keys, names and values repeated between requests, strings unique to a request are encoded with quote() instead.
+    """
+    return quote(s, safe=unreserved)
 
 class OAuth10aNoTokenException(Exception):
     pass
 
 class OAuth10a:
+    """HMAC-SHA1 request signing, can be used by several threads at once."""
     
     def __init__(self, consumerKey, consumerSecret, oauthToken = None, oauthTokenSecret = None):
         self._consumerKey = consumerKey
         self._consumerSecret = consumerSecret
-        self._oauthToken = oauthToken
-        self._oauthTokenSecret = oauthTokenSecret
+        self.updateOAuthToken(oauthToken, oauthTokenSecret)
     
     def updateOAuthToken(self, token, secret):
         self._oauthToken = token
         self._oauthTokenSecret = secret
-    
-    def _getOAuthParams(self):
-        params = {
-            'oauth_consumer_key':     self._consumerKey,
-            'oauth_signature_method': 'HMAC-SHA1',
-            'oauth_version':          '1.0',
-            'oauth_timestamp':        str(int(datetime.now().timestamp())),
-            'oauth_nonce':            generate_nonce(8),
-        }
+        
+        params = [
+            ('oauth_consumer_key',     self._consumerKey),
+            ('oauth_signature_method', 'HMAC-SHA1'),
+            ('oauth_version',          '1.0'),
+        ]
         if (self._oauthToken is not None):
-            params['oauth_token'] = self._oauthToken
-            
-        return params
-    
-    @staticmethod
-    def _sortOAuthParams(oauth_params_list):
-        return sorted(oauth_params_list, key=lambda x: x[0] + x[1])
+            params.append(('oauth_token', self._oauthToken))
+        
+        key = percentEncode(self._consumerSecret) + '&'
+        if (self._oauthTokenSecret is not None):
+            key += percentEncode(self._oauthTokenSecret)
+        
+        # encoded static parameters and keyed HMAC state, copied for every signature
+        # replaced as a whole, so concurrent requests never mix old and new token
+        self._signing = ([(percentEncode(k), percentEncode(v)) for k, v in params], hmac.new(key.encode('utf-8'), digestmod=sha1))
     
-    @staticmethod
-    def _OAuthParamsToHeader(oauth_params):
+    def getOAuthHeader(self, method, url, query_post_params = {}, additional_oauth_params = {}, timestamp = None, nonce = None):
+        """Return the Authorization header for a request.
         
-        parts = []
-        parts += ['{0:s}="{1:s}"'.format(quote(k, safe='-._~'), quote(v, safe='-._~')) for k, v in OAuth10a._sortOAuthParams(list(oauth_params.items()))]
-        return 'Authorization: OAuth ' + ', '.join(parts)
-    
-    def getOAuthHeader(self, method, url, query_post_params = {}, additional_oauth_params = {}):
-    
-        oauth_params = self._getOAuthParams()
-        oauth_params.update(additional_oauth_params)
-        if ('oauth_signature' in oauth_params):
-            del oauth_params['oauth_signature']
-        terms = list(oauth_params.items()) + list(query_post_params.items())
-        terms = OAuth10a._sortOAuthParams(terms)
+        url must not contain a query, query and form parameters are passed in query_post_params instead.
+        timestamp and nonce are generated unless given, e.g. for test vectors.
+        """
         
-        text = method + '&' + quote(url, safe='') + '&' + quote('&').join([quote(k) + quote('=') + quote(v) for k, v in terms])
-        key = quote(self._consumerSecret) + '&'
-        if (self._oauthTokenSecret is not None):
-            key += quote(self._oauthTokenSecret)
-        hashed = hmac.new(key.encode('utf-8'), text.encode('utf-8'), sha1)
+        static, state = self._signing
+        additional = {percentEncode(k): percentEncode(v) for k, v in additional_oauth_params.items() if k != 'oauth_signature'}
+        oauth_params = static + [
+            ('oauth_timestamp', str(int(time.time())) if timestamp is None else timestamp),
+            ('oauth_nonce',     generate_nonce() if nonce is None else nonce),
+        ]
+        oauth_params = [(k, v) for k, v in oauth_params if k not in additional] + list(additional.items())
+        
+        # sorted by encoded name, then encoded value
+        terms = sorted(oauth_params + [(percentEncode(k), percentEncode(v)) for k, v in query_post_params.items()])
+        text = method.upper() + '&' + percentEncode(url) + '&' + quote('&'.join(k + '=' + v for k, v in terms), safe=unreserved)
         
-        oauth_params['oauth_signature'] = b64encode(hashed.digest()).decode('utf-8')
+        hashed = state.copy()
+        hashed.update(text.encode('utf-8'))
+        oauth_params.append(('oauth_signature', quote(b64encode(hashed.digest()).decode('utf-8'), safe=unreserved)))
         
-        return OAuth10a._OAuthParamsToHeader(oauth_params)
+        return 'Authorization: OAuth ' + ', '.join('{0:s}="{1:s}"'.format(k, v) for k, v in sorted(oauth_params))
 
-def fn_register(oauth, config):
+def fn_register(oauth, config, client):
 
     if ('oauthCallback' not in config or config['oauthCallback'] != 'oob'):
         print('oauthCallback missing from config or not \'oob\'...')
@@ -102,26 +131,20 @@ def fn_register(oauth, config):
     oauth1_authorize_url = site + '/oauth1/authorize'
     oauth1_access_url    = site + '/oauth1/access'
     
-    
-    c = pycurl.Curl()
-    c.setopt(c.CAINFO, certifi.where())
-    #c.setopt(c.VERBOSE, True)
-    
-    buffer = BytesIO()
     post_params = {}
-    c.setopt(c.POST, True)
-    c.setopt(c.URL, oauth1_request_url)
-    c.setopt(c.WRITEDATA, buffer)
-    c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('POST', oauth1_request_url, post_params, {'oauth_callback': config['oauthCallback']})])
-    c.setopt(c.POSTFIELDS, '')
-    c.perform()
-    
-    status = c.getinfo(c.RESPONSE_CODE)
+    response = client.request(
+        'POST',
+        oauth1_request_url,
+        lambda: [oauth.getOAuthHeader('POST', oauth1_request_url, post_params, {'oauth_callback': config['oauthCallback']})],
+        ''
+        )
+    
+    status = response.status
     if (status != 200):
         print('Requesting Authorization failed...')
         return -1
     
-    response = buffer.getvalue().decode('utf-8')
+    response = response.body.decode('utf-8')
     params = parse_qs(response)
     if (not(all(e in params for e in ['oauth_token', 'oauth_token_secret']))):
         print('Authorization Response did not contain required token and secret.')
@@ -148,20 +171,19 @@ def fn_register(oauth, config):
         'oauth_callback': config['oauthCallback']
     }
     
-    buffer = BytesIO()
-    c.setopt(c.POST, True)
-    c.setopt(c.URL, oauth1_access_url)
-    c.setopt(c.WRITEDATA, buffer)
-    c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('POST', oauth1_access_url, post_params, add_oauth_param)])
-    c.setopt(c.POSTFIELDS, '')
-    c.perform()
+    response = client.request(
+        'POST',
+        oauth1_access_url,
+        lambda: [oauth.getOAuthHeader('POST', oauth1_access_url, post_params, add_oauth_param)],
+        ''
+        )
     
-    status = c.getinfo(c.RESPONSE_CODE)
+    status = response.status
     if (status != 200):
         print('Accessing OAuth 1.0a failed...')
         return -4
     
-    response = buffer.getvalue().decode('utf-8')
+    response = response.body.decode('utf-8')
     params = parse_qs(response)
     if (not(all(e in params for e in ['oauth_token', 'oauth_token_secret']))):
         print('Authorization Response did not contain required token and secret.')
@@ -177,81 +199,446 @@ def fn_register(oauth, config):
 
     return 0
 
-def fn_test(oauth, config):
+def fn_test(oauth, config, client):
 
     site = config['url']
     site_root = site + '/wp-json{0:s}'
     
-    c = pycurl.Curl()
     url = site_root.format(posts_ep) + '/483'
     
     json_data = {
         'comment_status': 'open',
     }
     post_params = {}
-    buffer = BytesIO()
-    c.setopt(c.CAINFO, certifi.where())
-    c.setopt(c.URL, url)
-    c.setopt(c.WRITEDATA, buffer)
-    c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('POST', url), 'Content-Type: application/json; charset=utf-8'])
-    c.setopt(c.POSTFIELDS, json.dumps(json_data))
-    c.perform()
+    response = client.request('POST', url, lambda: [oauth.getOAuthHeader('POST', url), 'Content-Type: application/json; charset=utf-8'], json.dumps(json_data))
     
     # HTTP response code, e.g. 200.
-    status = c.getinfo(c.RESPONSE_CODE)
+    status = response.status
     if (status == 200):
         print('Erfolg!!!')
-    print('Status: %d' % c.getinfo(c.RESPONSE_CODE))
+    print('Status: %d' % status)
     # Elapsed time for the transfer.
-    print('Status: %f' % c.getinfo(c.TOTAL_TIME))
+    print('Status: %f' % response.time)
     
     print('-'*72)
-    print(buffer.getvalue().decode('UTF-8'))
+    print(response.body.decode('UTF-8'))
     print('-'*72)
     
-    c.close()
+    return 0
+
+def detectBatch(oauth, client, site):
+    """Return the maximum number of requests per batch (WordPress 5.6+) and the routes allowing batch requests.
+    
+    Routes are returned as [(pattern, methods)], WordPress rejects batch requests to any other route (e.g. comments and users).
+    The size is 0 if batching is not supported.
+    """
+    
+    url = site + '/wp-json/'
+    response = client.request('GET', url, lambda: [oauth.getOAuthHeader('GET', url)])
+    if (response.status != 200):
+        return 0, []
+    try:
+        routes = json.loads(response.body.decode('UTF-8'))['routes']
+        route = routes[batch_ep]
+    except (ValueError, KeyError, TypeError):
+        return 0, []
+    
+    size = 0
+    for endpoint in route.get('endpoints', []):
+        if ('POST' in endpoint.get('methods', [])):
+            size = endpoint.get('args', {}).get('requests', {}).get('maxItems', 25)
+            break
+    
+    allowed = []
+    for name, data in routes.items():
+        methods = set()
+        for endpoint in data.get('endpoints', []):
+            if (endpoint.get('allow_batch')):
+                methods.update(endpoint.get('methods', []))
+        if (methods):
+            # matched against request paths like WordPress does
+            allowed.append((re.compile(name, re.IGNORECASE), methods))
+    return size, allowed
+
+def batchAllowed(transfer, method, endpoint):
+    return any(method in methods and pattern.fullmatch(endpoint) for pattern, methods in transfer['batchRoutes'])
+
+def sendRequests(transfer, requests):
+    """Send a list of (method, endpoint, json_data), returning (status, body) for each request in order.
+    
+    Requests are grouped into batch requests if the site allows them for all routes and sent one by one otherwise.
+    Sending stops after the first failed request (or batch containing one), so fewer results may be returned.
+    """
+    
+    oauth = transfer['oauth']
+    client = transfer['client']
+    site_root = transfer['site_root']
+    headers = ['Content-Type: application/json; charset=utf-8']
+    results = []
+    
+    if (transfer['batch'] <= 0 or not all(batchAllowed(transfer, method, endpoint) for method, endpoint, json_data in requests)):
+        for method, endpoint, json_data in requests:
+            url = site_root.format(endpoint)
+            response = client.request(method, url, lambda: [oauth.getOAuthHeader(method, url)] + headers, json.dumps(json_data))
+            results.append((response.status, response.body.decode('UTF-8')))
+            if (response.status >= 300):
+                break
+        return results
+    
+    url = site_root.format(batch_ep)
+    for i in range(0, len(requests), transfer['batch']):
+        chunk = requests[i:i + transfer['batch']]
+        json_data = {
+            'validation': 'normal',
+            'requests':   [{'method': method, 'path': endpoint, 'body': body} for method, endpoint, body in chunk],
+        }
+        response = client.request('POST', url, lambda: [oauth.getOAuthHeader('POST', url)] + headers, json.dumps(json_data))
+        
+        status = response.status
+        if (status != 207):
+            # the whole batch failed
+            results += [(status, response.body.decode('UTF-8'))] * len(chunk)
+            break
+        
+        for item in json.loads(response.body.decode('UTF-8'))['responses']:
+            results.append((item['status'], json.dumps(item['body'])))
+        if (any(status >= 300 for status, body in results[-len(chunk):])):
+            break
+    return results
+
+def contentDisposition(name):
+    """Return a Content-Disposition header for uploading a file, non-ASCII names are sent using RFC 5987 encoding."""
+    
+    # header values must be ASCII, WordPress only reads filename and splits parameters at semicolons
+    fallback = ''.join(ch if ' ' <= ch < '\x7f' and ch != ';' else '_' for ch in unicodedata.normalize('NFKD', name) if not unicodedata.combining(ch))
+    fallback = fallback.replace('\\', '\\\\').replace('"', '\\"')
+    return 'Content-Disposition: attachment; filename="{0:s}"; filename*=UTF-8\'\'{1:s}'.format(fallback, quote(name, safe='!#$&+-.^_`|~'))
+
+def uploadMedia(transfer, path, name):
+    """Upload a media file streamed from disk, returning (status, body)."""
+    
+    oauth = transfer['oauth']
+    url = transfer['site_root'].format(media_ep)
+    headers = [
+        'Content-Type: ' + (mimetypes.guess_type(name)[0] or 'application/octet-stream'),
+        contentDisposition(name),
+        # do not wait for 100 Continue before sending the file
+        'Expect:',
+    ]
+    with open(path, 'rb') as f:
+        response = transfer['client'].request('POST', url, lambda: [oauth.getOAuthHeader('POST', url)] + headers, f)
+    return response.status, response.body.decode('UTF-8')
+
+def collectMedia(directory, links):
+    """Map (link, filename) of media linked from posts to the distinct files of the media store.
+    
+    Returns {link: sha256} and {sha256: (filename, path)} of all downloaded files and the bytes saved by deduplication.
+    """
+    
+    # scraped before media were stored by content
+    legacy = not os.path.isdir(os.path.join(directory, MediaStore.directory))
+    blobs = {}
+    files = {}
+    saved = 0
+    with MediaStore(directory) as store:
+        for link, filename in links:
+            stored = store.get(link)
+            if (stored is None and legacy and os.path.exists(os.path.join(directory, filename))):
+                store.add(link, filename, os.path.join(directory, filename), keep=True)
+                stored = store.get(link)
+            if (stored is None):
+                print('Warning: media file {0:s} was not downloaded, skipping.'.format(link))
+                continue
+            
+            digest, name, size = stored
+            blobs[link] = digest
+            if (digest in files):
+                saved += size
+            else:
+                files[digest] = (name, store.path(digest))
+    return blobs, files, saved
+
+def uploadAllMedia(transfer, directory, links, concurrency):
+    """Upload each distinct media file once, skipping files uploaded by an earlier run, up to concurrency at a time.
+    
+    Returns {link: (media_id, url)} or None on failure.
+    """
+    
+    journal = transfer['journal']
+    uploaded = journal.media()
+    blobs, files, saved = collectMedia(directory, links)
+    missing = [digest for digest in files if digest not in uploaded]
+    
+    print('Uploading {0:d} media files for {1:d} links ({2:d} already uploaded, {3:.1f} KiB saved by deduplication)...'.format(
+        len(missing), len(blobs), len(files) - len(missing), saved / 1024
+    ))
+    
+    def upload(digest):
+        name, path = files[digest]
+        try:
+            return uploadMedia(transfer, path, name)
+        except (pycurl.error, OSError) as e:
+            # only this file failed, the others are still uploaded
+            return None, str(e)
+    
+    failed = False
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = pool.map(upload, missing)
+        for digest, (status, body) in zip(missing, results):
+            if (status != 201):
+                print('Uploading media file {0:s} failed.'.format(files[digest][0]))
+                print(body)
+                failed = True
+                continue
+            
+            response = json.loads(body)
+            journal.recordMedia(digest, response['id'], response['source_url'])
+            print('Media file {0:s} is using ID {1:d}'.format(files[digest][0], response['id']))
+    
+    if (failed):
+        return None
+    uploaded = journal.media()
+    return {link: uploaded[digest] for link, digest in blobs.items()}
+
+def queueClose(transfer, key, post_id, title):
+    """Remember to close comments of a post, which is done for all posts at the end (see closeAll)."""
+    
+    with transfer['lock']:
+        transfer['close'].append((key, post_id, title))
+
+def closeAll(transfer, concurrency=1):
+    """Close comments of all queued posts in bulk, up to concurrency requests (or batches) at a time, returning 0 on success."""
+    
+    with transfer['lock']:
+        queued = transfer['close']
+        transfer['close'] = []
+    if (not queued):
+        return 0
+    
+    print('Closing comments of {0:d} posts...'.format(len(queued)))
+    size = max(1, transfer['batch'])
+    chunks = [queued[i:i + size] for i in range(0, len(queued), size)]
+    
+    def close(chunk):
+        return sendRequests(transfer, [('POST', '{0:s}/{1:d}'.format(posts_ep, post_id), {'comment_status': 'closed'}) for key, post_id, title in chunk])
+    
+    with ThreadPoolExecutor(concurrency) as pool:
+        for chunk, results in zip(chunks, pool.map(close, chunks)):
+            for (key, post_id, title), (status, body) in zip(chunk, results):
+                if (status != 200):
+                    print('    Closing comments for post \'{0:s}\' failed.'.format(title))
+                    print(body)
+                    transfer['failed'] = True
+                    continue
+                transfer['journal'].recordClosed(key)
+    return -1 if transfer['failed'] else 0
+
+def createPost(transfer, key, entry):
+    """Create a post, returning (post_id, comments) or None on failure.
+    
+    Posts found in transfer['journal'] were created by an earlier run and are not created again.
+    comments is empty if there is nothing left to do, otherwise the comments need to be created (see createComments).
+    """
+    
+    oauth = transfer['oauth']
+    client = transfer['client']
+    site_root = transfer['site_root']
+    journal = transfer['journal']
+    url = site_root.format(posts_ep)
+    
+    known = journal.post(key)
+    if (known is not None and known[1]):
+        # completely transferred
+        return known[0], []
+    
+    title = entry['title']
+    oldAuthorId = entry['author_id']
+    categories = entry['categories']
+    comments = [] if ('entries' not in entry['comments']) else entry['comments']['entries']
+    content = entry['content']
+    date = datetime.fromisoformat(entry['date'])
+    
+    print('Processing \'{0:s}\' with {1:d} comments...'.format(title, len(comments)))
+    
+    if (known is not None):
+        print('    Resuming post #{0:d}.'.format(known[0]))
+        return known[0], comments
     
+    categoryIds = [transfer['category_map'][c] for c in categories]
+    authorId = transfer['users'][transfer['author_map'][oldAuthorId]['slug']]
+    
+    content = reworkContent(content)
+    
+    # images were stripped when scraping, put the uploaded files where they were
+    media = [transfer['media'].get(m['url']) for m in entry.get('media', [])]
+    content = rewriteLinks(content, {m['url']: uploaded[1] for m, uploaded in zip(entry.get('media', []), media) if uploaded is not None})
+    images = [None if uploaded is None else image_markup.format(uploaded[1], uploaded[0]) for uploaded in media]
+    content, placed = placeMedia(content, images)
+    # scrapes made before images were marked get them at the end of the post
+    for ix, image in enumerate(images):
+        if (image is not None and ix not in placed):
+            content += '\r\n' + image
+    
+    json_data = {
+        'date_gmt':       date.astimezone(timezone.utc).isoformat(),
+        'status':         'publish',
+        'title':          title,
+        'content':        content,
+        'author':         str(authorId),
+        'comment_status': 'closed' if (comments == []) else 'open',
+        'ping_status':    'closed',
+        'format':         'standard',
+        'categories':     [str(e) for e in categoryIds]
+    }
+    response = client.request('POST', url, lambda: [oauth.getOAuthHeader('POST', url), 'Content-Type: application/json; charset=utf-8'], json.dumps(json_data))
+    
+    status = response.status
+    if (status != 201):
+        print('   Creating post \'{0:s}\' failed.'.format(title))
+        print(response.body.decode('UTF-8'))
+        transfer['failed'] = True
+        return None
+    
+    response = json.loads(response.body.decode('UTF-8'))
+    post_id = response['id']
+    journal.recordPost(key, post_id, comments == [])
+    
+    print('    Created post #{0:d}.'.format(post_id))
+    return post_id, comments
+
+def createComments(transfer, key, post_id, title, comments):
+    """Create the comments of a post in their original order and queue closing its comments, returning 0 on success.
+    
+    Comments found in transfer['journal'] were created by an earlier run and are skipped.
+    """
+    
+    journal = transfer['journal']
+    created = journal.comments(key)
+    missing = [ix for ix in range(len(comments)) if ix not in created]
+    requests = []
+    for ix in missing:
+        comment = comments[ix]
+        
+        comment_author = comment['authorName']
+        comment_date = datetime.fromisoformat(comment['date'])
+        comment_content = comment['content']
+        
+        json_data = {
+            'date_gmt':       comment_date.astimezone(timezone.utc).isoformat(),
+            'author_name':    comment_author,
+            'author_email':   'sysmail@bingo-ev.de',
+            'content':        comment_content,
+            'post':           str(post_id),
+            'status':         'approve',
+        }
+        requests.append(('POST', comments_ep, json_data))
+    
+    # record every comment created, a failed batch may still have created some of them
+    failure = None
+    for comment_ix, (status, body) in zip(missing, sendRequests(transfer, requests)):
+        if (status == 201):
+            journal.recordComment(key, comment_ix, json.loads(body)['id'])
+        elif (failure is None):
+            failure = (comment_ix, body)
+    
+    if (failure is not None):
+        print('   Creating comment {0:d} of \'{1:s}\' failed.'.format(failure[0], title))
+        print(failure[1])
+        transfer['failed'] = True
+        return -1
+    
+    queueClose(transfer, key, post_id, title)
     return 0
 
-def fn_transfer(oauth, config, args):
+def transferPost(transfer, key, entry):
+    """Create a post and its comments, returning 0 on success."""
+    
+    created = createPost(transfer, key, entry)
+    if (created is None):
+        return -1
+    post_id, comments = created
+    if (comments != []):
+        return createComments(transfer, key, post_id, entry['title'], comments)
+    return 0
+
+def fetchAll(transfer, endpoint, perPage=100):
+    """Retrieve all items of a collection endpoint or None on failure.
+    
+    The number of pages is taken from the X-WP-TotalPages header of the first page, remaining pages are fetched concurrently.
+    """
+    
+    oauth = transfer['oauth']
+    client = transfer['client']
+    url = transfer['site_root'].format(endpoint)
+    
+    def fetch(page):
+        query_params = {
+            'page':     str(page),
+            'per_page': str(perPage),
+        }
+        return client.request('GET', url + '?' + urlencode(query_params), lambda: [oauth.getOAuthHeader('GET', url, query_params)])
+    
+    response = fetch(1)
+    if (response.status != 200):
+        return None
+    items = json.loads(response.body.decode('UTF-8'))
+    
+    pages = int(response.headers.get('x-wp-totalpages', '1'))
+    if (pages > 1):
+        with ThreadPoolExecutor(min(pages - 1, page_workers)) as pool:
+            for response in pool.map(fetch, range(2, pages + 1)):
+                if (response.status != 200):
+                    return None
+                items += json.loads(response.body.decode('UTF-8'))
+    return items
+
+def lookupIds(transfer, kind, endpoint, field, names, refresh):
+    """Return {name: id} of the items of endpoint identified by field (e.g. 'slug') or None on failure.
+    
+    The map is cached in the journal and only retrieved again if names are missing from it or refresh is set.
+    """
+    
+    journal = transfer['journal']
+    if (not refresh):
+        cached = journal.lookups(kind)
+        if (all(name in cached for name in names)):
+            print('Using cached IDs of {0:s} (use --refresh to retrieve them again).'.format(kind))
+            return cached
+    
+    print('Retrieving existing {0:s}...'.format(kind))
+    items = fetchAll(transfer, endpoint)
+    if (items is None):
+        print('Retrieving existing {0:s} failed...'.format(kind))
+        return None
+    
+    ids = {item[field]: item['id'] for item in items}
+    journal.recordLookups(kind, ids, replace=True)
+    return ids
+
+def fn_transfer(oauth, config, args, client):
 
-    blogEntries = []
     directory = args.directory
     createUser = args.create_users
     
-    print('Loading posts...', end='')
-    for entry in os.scandir(directory):
-        if (not entry.is_file()):
-            continue
-        if (entry.name == 'authors.yml'):
-            continue
-        if (entry.name == 'categories.yml'):
-            continue
-        if (not(entry.name.endswith('.yml'))):
-            continue
-        with open(entry.path, 'r', encoding='utf-8') as f:
-            data = yaml.load(f)
-        blogEntries.append(data)
-
-    print('Done.')
-    
-    print('Extracting post categories...')
-    # extract categories
-    categories = set()
-    
-    for entry in blogEntries:
-        categories.update(entry['categories'])
+    # only categories and authors are needed up front, posts are streamed from disk later on
+    print('Indexing posts...', end='')
+    with openStore(directory) as store, PostIndex(directory) as index:
+        index.update(store, args.workers)
+        print('Done.')
+        
+        print('Extracting post categories...')
+        categories = index.categories()
+        
+        print('Extracting post authors...')
+        authorIds = index.authorIds()
+        
+        print('Extracting media files...')
+        mediaLinks = index.mediaLinks()
     
     # extract authors
     with open(directory + '/authors.yml', 'r', encoding='utf-8') as f:
         authorMap = yaml.load(f)
     
-    authorIds = set()
-    print('Extracting post authors...')
-    
-    for entry in blogEntries:
-        authorIds.add(entry['author_id'])
-    
     if (any([e for e in authorIds if e not in authorMap])):
         print('Error: Author ID {0:d} unmapped.')
         return -2
@@ -265,248 +652,149 @@ def fn_transfer(oauth, config, args):
     site = config['url']
     site_root = site + '/wp-json{0:s}'
     
-    print('Retrieving existing post categories...')
-    
-    query_params = {
-        'per_page': str(100),
+    batch, batchRoutes = (0, []) if args.no_batch else detectBatch(oauth, client, site)
+    transfer = {
+        'oauth':        oauth,
+        'client':       client,
+        'site_root':    site_root,
+        'batch':        batch,
+        'batchRoutes':  batchRoutes,
+        'lock':         threading.Lock(),
+        'close':        [],
+        'failed':       False,
     }
-    buffer = BytesIO()
-    
-    c = pycurl.Curl()
-    url = site_root.format(categories_ep)
-    c.setopt(c.URL, url + '?' + urlencode(query_params))
-    
-    c.setopt(c.CAINFO, certifi.where())
-    c.setopt(c.WRITEDATA, buffer)
-    c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('GET', url, query_params)])
-    c.perform()
- 
-    # HTTP response code, e.g. 200.
-    status = c.getinfo(c.RESPONSE_CODE)
-    if (status != 200):
-        print('Retrieving existing categories failed...')
-        return -1
-    
-    response = json.loads(buffer.getvalue().decode('UTF-8'))
-    blogCategories = {}
-    for category in response:
-        blogCategories[category['name']] = category['id']
+    if (transfer['batch'] > 0):
+        print('Using batch requests of up to {0:d} requests for routes allowing them.'.format(transfer['batch']))
     
-    category_map = {k: None for k in categories}
-    for k in category_map:
-        if (k in blogCategories):
-            category_map[k] = blogCategories[k]
-    
-    for k, v in category_map.items():
-        if (v is None):
-            print('Creating category {0:s}...'.format(k))
+    with TransferJournal(directory, site) as journal:
+        transfer['journal'] = journal
+        
+        blogCategories = lookupIds(transfer, 'categories', categories_ep, 'name', categories, args.refresh)
+        if (blogCategories is None):
+            return -1
+        
+        category_map = {k: blogCategories.get(k) for k in categories}
+        
+        missing = [k for k, v in category_map.items() if v is None]
+        requests = []
+        for k in missing:
+            print('{0:s} category {1:s}...'.format('Would create' if args.dry_run else 'Creating', k))
             
             json_data = {
                 'name': k,
             }
-            post_params = {}
-            buffer = BytesIO()
-            c.setopt(c.URL, url)
-            c.setopt(c.WRITEDATA, buffer)
-            c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('POST', url), 'Content-Type: application/json; charset=utf-8'])
-            c.setopt(c.POSTFIELDS, json.dumps(json_data))
-            c.perform()
-            
-            status = c.getinfo(c.RESPONSE_CODE)
+            requests.append(('POST', categories_ep, json_data))
+        
+        if (args.dry_run):
+            requests = []
+        for k, (status, body) in zip(missing, sendRequests(transfer, requests)):
             if (status != 201):
                 print('Creating category failed.')
-                print(buffer.getvalue().decode('UTF-8'))
+                print(body)
                 return -1
             
-            response = json.loads(buffer.getvalue().decode('UTF-8'))
+            response = json.loads(body)
             category_map[k] = response['id']
-            print('Category {0:s} is using ID {1:d}'.format(k, response['id']))
-            
-        else:
-            print('Category {0:s} is using ID {1:d}'.format(k, v))
-    
-    print('Retrieving existing users...')
-    
-    query_params = {
-        'per_page': str(100),
-    }
-    buffer = BytesIO()
-    
-    c = pycurl.Curl()
-    url = site_root.format(users_ep)
-    c.setopt(c.URL, url + '?' + urlencode(query_params))
-    
-    c.setopt(c.CAINFO, certifi.where())
-    c.setopt(c.WRITEDATA, buffer)
-    c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('GET', url, query_params)])
-    c.perform()
- 
-    # HTTP response code, e.g. 200.
-    status = c.getinfo(c.RESPONSE_CODE)
-    if (status != 200):
-        print('Retrieving existing users failed...')
-        return -1
-    
-    response = json.loads(buffer.getvalue().decode('UTF-8'))
-    blogUsers = {}
-    
-    for user in response:
-        blogUsers[user['slug']] = user['id']
-    
-    if (not(createUser)):
-        unmappedUsers = [(k, v['slug']) for k, v in authorMap.items() if v['slug'] not in blogUsers]
-        if (any(unmappedUsers)):
-            for id, slug in unmappedUsers:
-                print('Error: user {0:s} does not exist on blog.'.format(slug))
-            return -2
-    else:
-        for k, v in authorMap.items():
-            if (v['slug'] in blogUsers):
-                continue
-            
-            print('Creating user {0:s}...'.format(v['slug']))
-            
-            json_data = {
-                'name':     v['name'],
-                'slug':     v['slug'],
-                'username': v['slug'],
-                'email':    v['slug'] + '@example.com',
-                'password': 'passw9rd!',
-            }
-            post_params = {}
-            buffer = BytesIO()
-            c.setopt(c.URL, url)
-            c.setopt(c.WRITEDATA, buffer)
-            c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('POST', url), 'Content-Type: application/json; charset=utf-8'])
-            c.setopt(c.POSTFIELDS, json.dumps(json_data).encode('UTF-8'))
-            c.perform()
-            
-            status = c.getinfo(c.RESPONSE_CODE)
-            if (status != 201):
-                print('Creating user failed.')
-                print(buffer.getvalue().decode('UTF-8'))
-                return -1
-            
-            response = json.loads(buffer.getvalue().decode('UTF-8'))
-            blogUsers[response['slug']] = response['id']
-            print('User {0:s} is using ID {1:d}'.format(response['slug'], response['id']))
-    
-    for k, v in authorMap.items():
-        print('User {0:s} is using ID {1:d}'.format(v['slug'], blogUsers[v['slug']]))
-    
-    # process posts
-    url = site_root.format(posts_ep)
-    
-    for entry in blogEntries:
+            journal.recordLookups('categories', {k: response['id']})
         
-        title = entry['title']
-        oldAuthorId = entry['author_id']
-        categories = entry['categories']
-        comments = [] if ('entries' not in entry['comments']) else entry['comments']['entries']
-        content = entry['content']
-        date = datetime.fromisoformat(entry['date'])
-        
-        print('Processing \'{0:s}\' with {1:d} comments...'.format(title, len(comments)))
-        
-        categoryIds = [category_map[c] for c in categories]
-        authorId = blogUsers[authorMap[oldAuthorId]['slug']]
-        
-        # rework content
-        #
-        # \r\n<br/>\r\n --> \r\n
-        # <p>\space*</p> --> kill
-        # \space+[word]+\r\n[word]+\space+ --> [word]+ [word+]
-        # \space+-\r\n[word]+ --> \space+- [word]+
-        content = re.sub(r'\r\n<br/>\r\n', r'\r\n', content)
-        content = re.sub(r'<p>\s*</p>', r'', content)
-        content = re.sub(r'\xA0', r'', content) #nbsp;
-        content = re.sub(r'(\w+)\r\n<a(.*)</a>\r\n(\w+)', r'\1 <a\2</a> \3', content)
-        content = re.sub(r'</a>\r\n([.:,])', r'</a>\1', content)
-        content = re.sub(r'(\s+)([,.:\w\-\(\)]+)\s*\r\n(?!\d)([.,:\w\-\(\)]+)(\s)', r'\1\2 \3\4', content)
-        content = re.sub(r'(\s+)([,.:\w\-\(\)]+)\r\n\s*(?!\d)([.,:\w\-\(\)]+)(\s)', r'\1\2 \3\4', content)
-        content = re.sub(r'(\s+)-\r\n(\s+)([.,\w\-\(\)]+)', r'\1-\2\3', content)
-        
-        json_data = {
-            'date_gmt':       date.astimezone(timezone.utc).isoformat(),
-            'status':         'publish',
-            'title':          title,
-            'content':        content,
-            'author':         str(authorId),
-            'comment_status': 'closed' if (comments == []) else 'open',
-            'ping_status':    'closed',
-            'format':         'standard',
-            'categories':     [str(e) for e in categoryIds]
-        }
-        post_params = {}
-        buffer = BytesIO()
-        c.setopt(c.URL, url)
-        c.setopt(c.WRITEDATA, buffer)
-        c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('POST', url), 'Content-Type: application/json; charset=utf-8'])
-        c.setopt(c.POSTFIELDS, json.dumps(json_data))
-        c.perform()
+        for k, v in category_map.items():
+            if (v is not None):
+                print('Category {0:s} is using ID {1:d}'.format(k, v))
         
-        status = c.getinfo(c.RESPONSE_CODE)
-        if (status != 201):
-            print('   Creating post \'{0:s}\' failed.'.format(title))
-            print(buffer.getvalue().decode('UTF-8'))
+        slugs = {v['slug'] for v in authorMap.values()}
+        blogUsers = lookupIds(transfer, 'users', users_ep, 'slug', slugs, args.refresh)
+        if (blogUsers is None):
             return -1
         
-        response = json.loads(buffer.getvalue().decode('UTF-8'))
-        post_id = response['id']
-        
-        print('    Created post #{0:d}.'.format(post_id))
-        
-        if (comments != []):
-            # create comments
-            comment_url = site_root.format(comments_ep)
-            
-            for comment_ix, comment in enumerate(comments):
+        if (not(createUser)):
+            unmappedUsers = [(k, v['slug']) for k, v in authorMap.items() if v['slug'] not in blogUsers]
+            if (any(unmappedUsers)):
+                for id, slug in unmappedUsers:
+                    print('Error: user {0:s} does not exist on blog.'.format(slug))
+                return -2
+        else:
+            requests = []
+            for k, v in authorMap.items():
+                if (v['slug'] in blogUsers):
+                    continue
                 
-                comment_author = comment['authorName']
-                comment_date = datetime.fromisoformat(comment['date'])
-                comment_content = comment['content']
+                print('{0:s} user {1:s}...'.format('Would create' if args.dry_run else 'Creating', v['slug']))
                 
                 json_data = {
-                    'date_gmt':       comment_date.astimezone(timezone.utc).isoformat(),
-                    'author_name':    comment_author,
-                    'author_email':   'sysmail@bingo-ev.de',
-                    'content':        comment_content,
-                    'post':           str(post_id),
-                    'status':         'approve',
+                    'name':     v['name'],
+                    'slug':     v['slug'],
+                    'username': v['slug'],
+                    'email':    v['slug'] + '@example.com',
+                    'password': 'passw9rd!',
                 }
-                post_params = {}
-                buffer = BytesIO()
-                c.setopt(c.URL, comment_url)
-                c.setopt(c.WRITEDATA, buffer)
-                c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('POST', comment_url), 'Content-Type: application/json; charset=utf-8'])
-                c.setopt(c.POSTFIELDS, json.dumps(json_data))
-                c.perform()
-                
-                status = c.getinfo(c.RESPONSE_CODE)
+                requests.append(('POST', users_ep, json_data))
+            
+            if (args.dry_run):
+                requests = []
+            for status, body in sendRequests(transfer, requests):
                 if (status != 201):
-                    print('   Creating comment {0:d} failed.'.format(comment_ix))
-                    print(buffer.getvalue().decode('UTF-8'))
+                    print('Creating user failed.')
+                    print(body)
                     return -1
-            
-            post_url = '{0:s}/{1:d}'.format(site_root.format(posts_ep), post_id)
-            json_data = {
-                'comment_status': 'closed',
-            }
-            post_params = {}
-            buffer = BytesIO()
-            c.setopt(c.URL, post_url)
-            c.setopt(c.WRITEDATA, buffer)
-            c.setopt(c.HTTPHEADER, [oauth.getOAuthHeader('POST', post_url), 'Content-Type: application/json; charset=utf-8'])
-            c.setopt(c.POSTFIELDS, json.dumps(json_data))
-            c.perform()
-            
-            status = c.getinfo(c.RESPONSE_CODE)
-            if (status != 200):
-                print('    Closing comments for post \'{0:s}\' failed.'.format(title))
-                print(buffer.getvalue().decode('UTF-8'))
-                return -1
-    
-    return 0
+                
+                response = json.loads(body)
+                blogUsers[response['slug']] = response['id']
+                journal.recordLookups('users', {response['slug']: response['id']})
+                print('User {0:s} is using ID {1:d}'.format(response['slug'], response['id']))
+        
+        for k, v in authorMap.items():
+            if (v['slug'] in blogUsers):
+                print('User {0:s} is using ID {1:d}'.format(v['slug'], blogUsers[v['slug']]))
+        
+        if (args.dry_run):
+            with openStore(directory) as store:
+                keys = store.keys()
+            pending = 0
+            for key in keys:
+                known = journal.post(key)
+                if (known is None or not known[1]):
+                    pending += 1
+            print('{0:d} of {1:d} posts would be transferred.'.format(pending, len(keys)))
+            uploaded = journal.media()
+            blobs, files, saved = collectMedia(directory, mediaLinks)
+            print('{0:d} of {1:d} media files would be uploaded.'.format(len([e for e in files if e not in uploaded]), len(files)))
+            return 0
+        
+        media = uploadAllMedia(transfer, directory, mediaLinks, args.media_concurrency)
+        if (media is None):
+            return -1
+        
+        # process posts
+        transfer['category_map'] = category_map
+        transfer['users'] = blogUsers
+        transfer['author_map'] = authorMap
+        transfer['media'] = media
+        
+        print('Journal: {0:s} already transferred.'.format(journal.stats()))
+        
+        if (args.concurrency <= 1):
+            for key, entry in streamPosts(directory, args.workers):
+                if (transferPost(transfer, key, entry) != 0):
+                    break
+            closeAll(transfer)
+            return -1 if transfer['failed'] else 0
+        
+        # up to concurrency posts are created at the same time, each ahead of its comments,
+        # WordPress orders posts by date_gmt, so the site is the same as after a serial run
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            pending = deque()
+            for key, entry in streamPosts(directory, args.workers):
+                pending.append(pool.submit(transferPost, transfer, key, entry))
+                # do not load posts too far ahead of the uploads
+                while (len(pending) > 2 * args.concurrency or (pending and pending[0].done())):
+                    pending.popleft().result()
+                if (transfer['failed']):
+                    break
+            for future in pending:
+                future.result()
+        closeAll(transfer, args.concurrency)
+    
+    return -1 if transfer['failed'] else 0
     
 def checkConfig(config):
     
@@ -516,10 +804,18 @@ def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--config', default='config.yml')
+    parser.add_argument('--rate', type=float, default=None, help='maximum number of requests per second (default: unlimited)')
+    parser.add_argument('--retries', type=int, default=5, help='number of retries of failed or throttled requests')
     subparsers = parser.add_subparsers(title='command', dest='subcommand', help='sub-command', required=True)
     parser_register = subparsers.add_parser('register')
     parser_transfer = subparsers.add_parser('transfer')
     parser_transfer.add_argument('--create-users', action='store_true', default=False)
+    parser_transfer.add_argument('--no-batch', action='store_true', default=False, help='do not use the batch endpoint of WordPress 5.6+')
+    parser_transfer.add_argument('--concurrency', type=int, default=1, help='number of posts to upload in parallel')
+    parser_transfer.add_argument('--media-concurrency', type=int, default=4, help='number of media files to upload in parallel')
+    parser_transfer.add_argument('--refresh', action='store_true', default=False, help='retrieve categories and users from the site even if cached')
+    parser_transfer.add_argument('--dry-run', action='store_true', default=False, help='only report what would be created')
+    parser_transfer.add_argument('--workers', type=int, default=None, help='number of processes for parsing posts (default: number of CPUs)')
     parser_transfer.add_argument('directory', default=None)
     parser_test = subparsers.add_parser('test')
     
@@ -542,15 +838,23 @@ def main():
                      config.get('oauthTokenSecret', None)
                     )
     
-    if (args.subcommand == 'register'):
-        return fn_register(oauth, config)
-    elif (args.subcommand == 'test'):
-        return fn_test(oauth, config)
-    elif (args.subcommand == 'transfer'):
-        return fn_transfer(oauth, config, args)
-    else:
-        print('Unknown command \'{0:s}\'...'.format(args.subcommand))
-        return -2
+    concurrency = max(8, getattr(args, 'concurrency', 1), getattr(args, 'media_concurrency', 1))
+    policy = RequestPolicy(concurrency, rate=args.rate, retries=args.retries)
+    client = HttpClient(maxIdlePerHost=concurrency, policy=policy)
+    try:
+        if (args.subcommand == 'register'):
+            return fn_register(oauth, config, client)
+        elif (args.subcommand == 'test'):
+            return fn_test(oauth, config, client)
+        elif (args.subcommand == 'transfer'):
+            return fn_transfer(oauth, config, args, client)
+        else:
+            print('Unknown command \'{0:s}\'...'.format(args.subcommand))
+            return -2
+    finally:
+        print('HTTP: {0:s}'.format(client.stats()))
+        print('Requests: {0:s}'.format(policy.stats()))
+        client.close()
     
     return 0
     
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import html
+import lxml.html
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+
+# archive pages only need the content column, entry pages only need the
+# entry itself (for the extended body) and the comment section
+archive_strainer = SoupStrainer('td', id='content')
+entry_strainer = SoupStrainer('div', class_=re.compile(r'(^|\s)serendipity_(entry|section_comments)(\s|$)'))
+
+archive_xpath = "//td[@id='content']"
+entry_xpath = (
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' serendipity_entry ')"
+    " or contains(concat(' ', normalize-space(@class), ' '), ' serendipity_section_comments ')]"
+    )
+# pages are parsed from bytes, lxml rejects strings starting with an XML declaration as used by XHTML templates
+html_parser = lxml.html.HTMLParser(encoding='utf-8')
+# libxml2 percent-encodes URI attributes when serializing HTML unless they only contain these characters,
+# other values are replaced by a placeholder and restored afterwards to keep them as they are
+uri_attributes = ('href', 'src', 'action', 'name')
+uri_safe_re = re.compile(r"[A-Za-z0-9\-_.!~*'()@/:=?;#%&,+]*")
+uri_placeholder_re = re.compile(r'pageparser-uri-(\d+)')
+
+def _parseFull(data, strainer, xpath):
+    return BeautifulSoup(data.decode('UTF-8'), 'lxml')
+
+def _parseStrainer(data, strainer, xpath):
+    return BeautifulSoup(data.decode('UTF-8'), 'lxml', parse_only=strainer)
+
+def _parseLxml(data, strainer, xpath):
+    
+    # select subtrees using libxml2 directly and only build those with BeautifulSoup
+    document = lxml.html.document_fromstring(data, parser=html_parser)
+    selected = []
+    for element in document.xpath(xpath):
+        if (any(parent in selected for parent in element.iterancestors())):
+            continue
+        selected.append(element)
+    
+    values = []
+    for e in selected:
+        for element in e.iter():
+            for name in uri_attributes:
+                value = element.get(name)
+                if (value is not None and not uri_safe_re.fullmatch(value)):
+                    element.set(name, 'pageparser-uri-{0:d}'.format(len(values)))
+                    values.append(value)
+    
+    markup = ''.join(lxml.html.tostring(e, encoding='unicode', with_tail=False) for e in selected)
+    if (values):
+        markup = uri_placeholder_re.sub(lambda m: html.escape(values[int(m.group(1))]), markup)
+    return BeautifulSoup(markup, 'lxml')
+
+parsers = {
+    'full':     _parseFull,
+    'strainer': _parseStrainer,
+    'lxml':     _parseLxml,
+}
+
+def parseArchivePage(data, backend='lxml'):
+    """Parse an archive page, keeping at least td#content."""
+    return parsers[backend](data, archive_strainer, archive_xpath)
+
+def parseEntryPage(data, backend='lxml'):
+    """Parse an entry page, keeping at least div.serendipity_entry and div.serendipity_section_comments."""
+    return parsers[backend](data, entry_strainer, entry_xpath)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import os
+import sqlite3
+from corpus import loadPosts
+from datetime import datetime
+
+schema = '''
+CREATE TABLE IF NOT EXISTS posts (
+    key            TEXT PRIMARY KEY,
+    mtime          INTEGER NOT NULL,
+    size           INTEGER NOT NULL,
+    date           TEXT NOT NULL,
+    year           INTEGER NOT NULL,
+    month          INTEGER NOT NULL,
+    author_id      INTEGER NOT NULL,
+    author         TEXT NOT NULL,
+    title          TEXT NOT NULL,
+    comments       INTEGER NOT NULL,
+    content_length INTEGER NOT NULL,
+    media          INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    key      TEXT NOT NULL REFERENCES posts(key) ON DELETE CASCADE,
+    category TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media (
+    key      TEXT NOT NULL REFERENCES posts(key) ON DELETE CASCADE,
+    url      TEXT NOT NULL,
+    filename TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_date ON posts(year, month);
+CREATE INDEX IF NOT EXISTS posts_author ON posts(author_id);
+CREATE INDEX IF NOT EXISTS categories_key ON categories(key);
+CREATE INDEX IF NOT EXISTS categories_category ON categories(category);
+CREATE INDEX IF NOT EXISTS media_key ON media(key);
+'''
+
+# columns available for grouping, category needs a join
+groups = {
+    'author':   'p.author',
+    'category': 'c.category',
+    'year':     'p.year',
+    'month':    'p.month',
+}
+
+class PostIndex:
+    """Post metadata of a scrape directory in an SQLite side-file.
+    
+    Posts are only re-read if the modification time or size of their file changed.
+    """
+    
+    filename = 'postIndex.sqlite'
+    # bumped whenever the schema changes, older indexes are rebuilt
+    version = 1
+    
+    def __init__(self, directory):
+        self._db = sqlite3.connect(os.path.join(directory, PostIndex.filename))
+        self._db.execute('PRAGMA foreign_keys=ON')
+        if (self._db.execute('PRAGMA user_version').fetchone()[0] != PostIndex.version):
+            self._db.executescript('DROP TABLE IF EXISTS media; DROP TABLE IF EXISTS categories; DROP TABLE IF EXISTS posts;')
+            self._db.execute('PRAGMA user_version={0:d}'.format(PostIndex.version))
+        self._db.executescript(schema)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def update(self, store, workers=None):
+        """Bring the index up to date with store, returning the number of (updated, removed, unchanged) posts."""
+        
+        stamps = store.stamps()
+        known = {key: (mtime, size) for key, mtime, size in self._db.execute('SELECT key, mtime, size FROM posts')}
+        removed = [key for key in known if key not in stamps]
+        changed = [key for key, stamp in stamps.items() if known.get(key) != stamp]
+        
+        with self._db:
+            self._db.executemany('DELETE FROM posts WHERE key = ?', ((key,) for key in removed + changed))
+            for key, post in loadPosts(store, changed, workers):
+                self._insert(key, stamps[key], post)
+        
+        return len(changed), len(removed), len(stamps) - len(changed)
+    
+    def _insert(self, key, stamp, post):
+        
+        date = datetime.fromisoformat(post['date'])
+        comments = post['comments'].get('entries', []) if post['comments'] else []
+        self._db.execute(
+            'INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                key,
+                stamp[0],
+                stamp[1],
+                post['date'],
+                date.year,
+                date.month,
+                post['author_id'],
+                post['author'],
+                post['title'],
+                len(comments),
+                len(post['content']),
+                len(post.get('media', [])),
+            )
+        )
+        self._db.executemany('INSERT INTO categories VALUES (?, ?)', ((key, c) for c in post['categories']))
+        self._db.executemany('INSERT INTO media VALUES (?, ?, ?)', ((key, m['url'], m['filename']) for m in post.get('media', [])))
+    
+    def categories(self):
+        return {row[0] for row in self._db.execute('SELECT DISTINCT category FROM categories')}
+    
+    def authorIds(self):
+        return {row[0] for row in self._db.execute('SELECT DISTINCT author_id FROM posts')}
+    
+    def mediaLinks(self):
+        """Return (link, filename) of all media files referenced by posts."""
+        return self._db.execute('SELECT DISTINCT url, filename FROM media ORDER BY url').fetchall()
+    
+    def groupBy(self, fields, descending=False):
+        """Count posts and comments grouped by fields (see groups), returning rows of (*fields, posts, comments)."""
+        
+        columns = ', '.join(groups[f] for f in fields)
+        join = ' JOIN categories c ON c.key = p.key' if 'category' in fields else ''
+        order = ', '.join(groups[f] + (' DESC' if descending else '') for f in fields)
+        return self._db.execute(
+            'SELECT {0:s}, COUNT(*), SUM(p.comments) FROM posts p{1:s} GROUP BY {0:s} ORDER BY {2:s}'.format(columns, join, order)
+        ).fetchall()
+    
+    def close(self):
+        self._db.close()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import math
+import pycurl
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# the request was not sent, so retrying is safe for any method
+connect_errors = {pycurl.E_COULDNT_RESOLVE_HOST, pycurl.E_COULDNT_CONNECT}
+# the request may have been processed, only idempotent requests are retried
+transfer_errors = {pycurl.E_OPERATION_TIMEDOUT, pycurl.E_PARTIAL_FILE, pycurl.E_GOT_NOTHING, pycurl.E_SEND_ERROR, pycurl.E_RECV_ERROR}
+
+# the server did not process the request, so retrying is safe for any method
+overload_status = {429, 503}
+# the request may have been processed, only idempotent requests are retried
+error_status = {500, 502, 504}
+idempotent = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+class TokenBucket:
+    """Allow rate requests per second on average with bursts of up to burst requests."""
+    
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(1.0, rate if burst is None else burst)
+        self._tokens = self.burst
+        self._time = time.monotonic()
+    
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._time) * self.rate)
+        self._time = now
+    
+    def wait(self, now):
+        """Return the number of seconds until a token is available."""
+        
+        self._refill(now)
+        return max(0.0, (1.0 - self._tokens) / self.rate)
+    
+    def take(self, now):
+        self._refill(now)
+        self._tokens -= 1.0
+
+class AimdController:
+    """Limit of concurrent requests using additive increase, multiplicative decrease.
+    
+    The limit grows by one per window of successful requests (as many requests as the limit) up to maximum.
+    It is halved on overload, i.e. 429/503 responses, timeouts or a rising latency:
+    the recent (short-term average) latency exceeding tolerance times the long-term average by more than slack seconds.
+    The limit is decreased at most once per window, so a burst of failures only counts once.
+    """
+    
+    def __init__(self, maximum, minimum=1, tolerance=2.0, slack=0.1, warmup=20):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.tolerance = tolerance
+        self.slack = slack
+        self._warmup = warmup
+        self._limit = float(self.maximum)
+        self._short = None
+        self._long = None
+        self._samples = 0
+        self._sinceDecrease = 0
+        self.lowest = self.maximum
+    
+    @property
+    def limit(self):
+        return max(self.minimum, int(self._limit))
+    
+    def _decrease(self):
+        
+        if (self._sinceDecrease < self.limit):
+            return
+        self._sinceDecrease = 0
+        self._limit = max(float(self.minimum), self._limit / 2)
+        self.lowest = min(self.lowest, self.limit)
+    
+    def overload(self):
+        
+        self._sinceDecrease += 1
+        self._decrease()
+    
+    def success(self, latency):
+        
+        self._sinceDecrease += 1
+        self._samples += 1
+        if (self._short is None):
+            self._short = self._long = latency
+        else:
+            self._short += 0.3 * (latency - self._short)
+            self._long += 0.02 * (latency - self._long)
+        
+        if (self._samples >= self._warmup and self._short > self.tolerance * self._long + self.slack):
+            self._decrease()
+        else:
+            self._limit = min(float(self.maximum), self._limit + 1.0 / self._limit)
+
+class _Host:
+    
+    def __init__(self, rate, burst, concurrency):
+        self.bucket = None if rate is None else TokenBucket(rate, burst)
+        self.controller = AimdController(concurrency)
+        self.inflight = 0
+        self.paused = 0.0
+
+class RequestPolicy:
+    """Rate limits, retries and adaptive concurrency for the requests of an HttpClient, per host.
+    
+    Requests to a host are limited to rate per second (token bucket, unlimited if None)
+    and to the concurrency limit of an AimdController, starting at (and never exceeding) concurrency.
+    Responses 429/503 and connection failures are retried for all requests, 500/502/504 and timeouts only for idempotent requests,
+    after a random delay of up to backoff * 2 ** attempt seconds (full jitter), at most maxBackoff.
+    A Retry-After header pauses all requests to the host for at least that long.
+    Can be shared between threads.
+    """
+    
+    def __init__(self, concurrency=4, rate=None, burst=None, retries=5, backoff=0.5, maxBackoff=60.0, connectTimeout=10, stallTimeout=60):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.connectTimeout = connectTimeout
+        self.stallTimeout = stallTimeout
+        self._hosts = {}
+        self._condition = threading.Condition()
+        self.retried = 0
+        self.throttled = 0
+    
+    def _host(self, url):
+        
+        parts = urlsplit(url)
+        host = self._hosts.get(parts.netloc)
+        if (host is None):
+            host = self._hosts[parts.netloc] = _Host(self.rate, self.burst, self.concurrency)
+        return host
+    
+    def configure(self, c):
+        """Set timeouts on a handle, a stalled transfer fails like a timeout."""
+        
+        c.setopt(c.CONNECTTIMEOUT, self.connectTimeout)
+        c.setopt(c.LOW_SPEED_LIMIT, 1)
+        c.setopt(c.LOW_SPEED_TIME, self.stallTimeout)
+    
+    @staticmethod
+    def _wait(host):
+        
+        if (host.inflight >= host.controller.limit):
+            return math.inf
+        now = time.monotonic()
+        wait = host.paused - now
+        if (host.bucket is not None):
+            wait = max(wait, host.bucket.wait(now))
+        return max(0.0, wait)
+    
+    @staticmethod
+    def _start(host):
+        
+        host.inflight += 1
+        if (host.bucket is not None):
+            host.bucket.take(time.monotonic())
+    
+    def wait(self, url):
+        """Return the number of seconds until a request to url may start, inf while the concurrency limit is reached."""
+        
+        with self._condition:
+            return RequestPolicy._wait(self._host(url))
+    
+    def start(self, url):
+        """Count a request to url as started, only if wait(url) returned 0."""
+        
+        with self._condition:
+            RequestPolicy._start(self._host(url))
+    
+    def begin(self, url):
+        """Block until a request to url may start and count it as started."""
+        
+        with self._condition:
+            host = self._host(url)
+            while True:
+                wait = RequestPolicy._wait(host)
+                if (wait <= 0):
+                    break
+                self._condition.wait(None if math.isinf(wait) else wait)
+            RequestPolicy._start(host)
+    
+    @staticmethod
+    def _retryAfter(value):
+        
+        if (value is None):
+            return 0.0
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return 0.0
+    
+    def end(self, url, method, attempt, response=None, error=None):
+        """Count a request as finished with response or pycurl error, returning the delay before retrying it or None."""
+        
+        retryAfter = 0.0
+        with self._condition:
+            host = self._host(url)
+            host.inflight -= 1
+            if (error is not None):
+                errno = error.args[0]
+                reason = error.args[1] if len(error.args) > 1 else str(errno)
+                retry = errno in connect_errors or (errno in transfer_errors and method in idempotent)
+                if (errno == pycurl.E_OPERATION_TIMEDOUT):
+                    host.controller.overload()
+            else:
+                status = response.status
+                reason = 'HTTP status {0:d}'.format(status)
+                retry = status in overload_status or (status in error_status and method in idempotent)
+                if (status in overload_status):
+                    self.throttled += 1
+                    host.controller.overload()
+                    retryAfter = RequestPolicy._retryAfter(response.headers.get('retry-after'))
+                    host.paused = max(host.paused, time.monotonic() + retryAfter)
+                elif (status < 500):
+                    host.controller.success(response.latency)
+            
+            retry = retry and attempt < self.retries
+            if (retry):
+                self.retried += 1
+            self._condition.notify_all()
+        
+        if (not retry):
+            return None
+        delay = max(retryAfter, random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** attempt)))
+        print('Retrying {0:s} \'{1:s}\' in {2:.1f}s after {3:s} ({4:d} of {5:d})...'.format(method, url, delay, reason, attempt + 1, self.retries))
+        return delay
+    
+    def stats(self):
+        
+        with self._condition:
+            limits = ', '.join(
+                '{0:s} {1:d} (lowest {2:d})'.format(name, host.controller.limit, host.controller.lowest)
+                for name, host in sorted(self._hosts.items())
+            )
+        return '{0:d} retries, {1:d} throttled responses, concurrency limit {2:s}'.format(self.retried, self.throttled, limits or 'none')
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import yaml
+from mediaStore import MediaStore
+
+# prefer libyaml, it is an order of magnitude faster than the pure Python implementation
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+Dumper = getattr(yaml, 'CDumper', yaml.Dumper)
+
+# files in a scrape directory that are not posts
+reserved = {'authors.yml', 'categories.yml', 'manifest.yml'}
+
+class PostStore:
+    """Scraped posts stored by key (e.g. '042'), iterated in key order.
+    
+    Authors and other metadata are always kept as YAML files next to the posts.
+    """
+    
+    # worth parsing in several processes, see corpus.loadPosts
+    parallel = False
+    
+    def __init__(self, directory):
+        self.directory = directory
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def __contains__(self, key):
+        return key in self.keys()
+    
+    def items(self):
+        for key in self.keys():
+            yield key, self.load(key)
+    
+    def _stampFiles(self, *paths):
+        
+        mtime = 0
+        size = 0
+        for path in paths:
+            if (os.path.exists(path)):
+                st = os.stat(path)
+                mtime = max(mtime, st.st_mtime_ns)
+                size += st.st_size
+        return mtime, size
+    
+    def stamps(self):
+        """Return {key: (mtime, size)} of the file(s) backing each post for change detection."""
+        
+        stamp = self._stampFiles(*self._files())
+        return {key: stamp for key in self.keys()}
+    
+    def close(self):
+        pass
+
+class YamlStore(PostStore):
+    """One YAML file per post, i.e. <key>.yml."""
+    
+    format = 'yaml'
+    parallel = True
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.yml')
+    
+    def keys(self):
+        
+        keys = []
+        for entry in os.scandir(self.directory):
+            if (entry.is_file() and entry.name.endswith('.yml') and entry.name not in reserved):
+                keys.append(entry.name[:-4])
+        return sorted(keys)
+    
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+    
+    def stamps(self):
+        
+        stamps = {}
+        for entry in os.scandir(self.directory):
+            if (entry.is_file() and entry.name.endswith('.yml') and entry.name not in reserved):
+                st = entry.stat()
+                stamps[entry.name[:-4]] = (st.st_mtime_ns, st.st_size)
+        return stamps
+    
+    def load(self, key):
+        
+        with open(self._path(key), 'rb') as f:
+            return yaml.load(f, Loader=Loader)
+    
+    def write(self, key, post):
+        
+        data = yaml.dump(post, Dumper=Dumper, encoding='utf-8', allow_unicode=True, default_flow_style=False)
+        with open(self._path(key), 'bw') as f:
+            f.write(data)
+
+class JsonLinesStore(PostStore):
+    """All posts in posts.jsonl, one {"key": ..., "post": ...} object per line.
+    
+    Posts are appended when written, the last line of a key wins.
+    """
+    
+    format = 'jsonl'
+    filename = 'posts.jsonl'
+    # keys are written first, so they can be read without decoding the whole line
+    key_re = re.compile(rb'\{"key": ("(?:[^"\\]|\\.)*")')
+    
+    def __init__(self, directory):
+        super().__init__(directory)
+        self._path = os.path.join(directory, JsonLinesStore.filename)
+        self._offsets = {}
+        self._file = None
+        self._size = 0
+        if (os.path.exists(self._path)):
+            with open(self._path, 'rb') as f:
+                for line in f:
+                    if (not line.endswith(b'\n')):
+                        break
+                    m = JsonLinesStore.key_re.match(line)
+                    if (m):
+                        self._offsets[json.loads(m.group(1))] = self._size
+                    self._size += len(line)
+    
+    def keys(self):
+        return sorted(self._offsets)
+    
+    def _files(self):
+        return [self._path]
+    
+    def __contains__(self, key):
+        return key in self._offsets
+    
+    def load(self, key):
+        
+        if (self._file is not None):
+            self._file.flush()
+        with open(self._path, 'rb') as f:
+            f.seek(self._offsets[key])
+            return json.loads(f.readline())['post']
+    
+    def items(self):
+        
+        if (not self._offsets):
+            return
+        if (self._file is not None):
+            self._file.flush()
+        with open(self._path, 'rb') as f:
+            for key in self.keys():
+                f.seek(self._offsets[key])
+                yield key, json.loads(f.readline())['post']
+    
+    def write(self, key, post):
+        
+        if (self._file is None):
+            self._file = open(self._path, 'ab')
+            # drop a partial line left behind by an interrupted run
+            self._file.truncate(self._size)
+        line = json.dumps({'key': key, 'post': post}, ensure_ascii=False).encode('utf-8') + b'\n'
+        # tell() still reports the end of file from before the truncate
+        self._offsets[key] = self._size
+        self._file.write(line)
+        self._size += len(line)
+        # a complete line per post, so an interrupted scrape keeps all finished posts
+        self._file.flush()
+    
+    def close(self):
+        
+        if (self._file is not None):
+            self._file.close()
+            self._file = None
+
+class SqliteStore(PostStore):
+    """All posts in posts.sqlite, stored as JSON by key."""
+    
+    format = 'sqlite'
+    filename = 'posts.sqlite'
+    
+    def __init__(self, directory):
+        super().__init__(directory)
+        self._db = sqlite3.connect(os.path.join(directory, SqliteStore.filename))
+        # WAL makes committing every post cheap
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS posts (key TEXT PRIMARY KEY, post TEXT NOT NULL)')
+        self._db.commit()
+    
+    def keys(self):
+        return [row[0] for row in self._db.execute('SELECT key FROM posts ORDER BY key')]
+    
+    def _files(self):
+        # the write-ahead log is checkpointed into the database when the last writer closes
+        return [os.path.join(self.directory, SqliteStore.filename)]
+    
+    def __contains__(self, key):
+        return self._db.execute('SELECT 1 FROM posts WHERE key = ?', (key,)).fetchone() is not None
+    
+    def load(self, key):
+        
+        row = self._db.execute('SELECT post FROM posts WHERE key = ?', (key,)).fetchone()
+        if (row is None):
+            raise KeyError(key)
+        return json.loads(row[0])
+    
+    def items(self):
+        for key, post in self._db.execute('SELECT key, post FROM posts ORDER BY key'):
+            yield key, json.loads(post)
+    
+    def write(self, key, post):
+        
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO posts (key, post) VALUES (?, ?)', (key, json.dumps(post, ensure_ascii=False)))
+    
+    def close(self):
+        self._db.close()
+
+formats = {
+    'yaml':   YamlStore,
+    'jsonl':  JsonLinesStore,
+    'sqlite': SqliteStore,
+}
+
+def detectFormat(directory):
+    """Guess the format of a scrape directory, YAML if there are no posts yet."""
+    
+    if (os.path.exists(os.path.join(directory, SqliteStore.filename))):
+        return 'sqlite'
+    if (os.path.exists(os.path.join(directory, JsonLinesStore.filename))):
+        return 'jsonl'
+    return 'yaml'
+
+def openStore(directory, format=None):
+    
+    if (format is None):
+        format = detectFormat(directory)
+    return formats[format](directory)
+
+def convert(source, destination, format):
+    """Copy all posts, metadata and media files of a scrape directory into another format, returning the number of posts."""
+    
+    os.makedirs(destination, exist_ok=True)
+    count = 0
+    media = set()
+    with openStore(source) as src, openStore(destination, format) as dst:
+        for key, post in src.items():
+            dst.write(key, post)
+            media.update((m['url'], m['filename']) for m in post.get('media', []))
+            count += 1
+    for name in reserved:
+        if (os.path.exists(os.path.join(source, name))):
+            shutil.copyfile(os.path.join(source, name), os.path.join(destination, name))
+    
+    with MediaStore(destination) as dst:
+        if (os.path.isdir(os.path.join(source, MediaStore.directory))):
+            with MediaStore(source) as src:
+                for link, (digest, filename) in src.links().items():
+                    dst.add(link, filename, src.path(digest), keep=True)
+        else:
+            # scraped before media were stored by content
+            for link, filename in media:
+                if (os.path.exists(os.path.join(source, filename))):
+                    dst.add(link, filename, os.path.join(source, filename), keep=True)
+        dst.linkNames()
+    return count
+
+def main():
+    
+    parser = argparse.ArgumentParser(description='Convert scraped posts between storage formats.')
+    parser.add_argument('--format', choices=sorted(formats), required=True, help='destination format')
+    parser.add_argument('source', help='scrape directory')
+    parser.add_argument('destination', help='directory to write to')
+    
+    args = parser.parse_args()
+    
+    if (os.path.abspath(args.source) == os.path.abspath(args.destination)):
+        print('Source and destination must be different directories.')
+        return -1
+    if (os.path.exists(args.destination) and os.listdir(args.destination)):
+        print('Destination \'{0:s}\' is not empty.'.format(args.destination))
+        return -1
+    
+    source_format = detectFormat(args.source)
+    
+    count = convert(args.source, args.destination, args.format)
+    print('Converted {0:d} posts from {1:s} to {2:s}.'.format(count, source_format, args.format))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
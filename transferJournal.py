@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+__author__ = "Robert Abel"
+__copyright__ = "Copyright (c) 2018–2019"
+__license__ = "MIT"
+
+import os
+import sqlite3
+import threading
+
+schema = '''
+CREATE TABLE IF NOT EXISTS posts (
+    site    TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    post_id INTEGER NOT NULL,
+    closed  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (site, key)
+);
+CREATE TABLE IF NOT EXISTS comments (
+    site       TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    ix         INTEGER NOT NULL,
+    comment_id INTEGER NOT NULL,
+    PRIMARY KEY (site, key, ix)
+);
+CREATE TABLE IF NOT EXISTS media (
+    site     TEXT NOT NULL,
+    name     TEXT NOT NULL,
+    media_id INTEGER NOT NULL,
+    url      TEXT NOT NULL,
+    PRIMARY KEY (site, name)
+);
+CREATE TABLE IF NOT EXISTS lookups (
+    site TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    id   INTEGER NOT NULL,
+    PRIMARY KEY (site, kind, name)
+);
+'''
+
+class TransferJournal:
+    """Record of posts, comments and media files already created on a site, so an interrupted transfer can be resumed.
+    
+    Every record is committed right away. Can be shared between threads.
+    """
+    
+    filename = 'transferJournal.sqlite'
+    
+    def __init__(self, directory, site):
+        self._site = site
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, TransferJournal.filename), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(schema)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def _query(self, sql, params):
+        with self._lock:
+            return self._db.execute(sql, (self._site,) + params).fetchall()
+    
+    def _record(self, sql, params):
+        with self._lock, self._db:
+            self._db.execute(sql, (self._site,) + params)
+    
+    def post(self, key):
+        """Return (post_id, closed) of a transferred post or None."""
+        
+        rows = self._query('SELECT post_id, closed FROM posts WHERE site = ? AND key = ?', (key,))
+        return (rows[0][0], bool(rows[0][1])) if rows else None
+    
+    def comments(self, key):
+        """Return {index: comment_id} of the transferred comments of a post."""
+        return dict(self._query('SELECT ix, comment_id FROM comments WHERE site = ? AND key = ?', (key,)))
+    
+    def recordPost(self, key, post_id, closed=False):
+        self._record('INSERT OR REPLACE INTO posts (site, key, post_id, closed) VALUES (?, ?, ?, ?)', (key, post_id, int(closed)))
+    
+    def recordComment(self, key, ix, comment_id):
+        self._record('INSERT OR REPLACE INTO comments (site, key, ix, comment_id) VALUES (?, ?, ?, ?)', (key, ix, comment_id))
+    
+    def recordClosed(self, key):
+        self._record('UPDATE posts SET closed = 1 WHERE site = ? AND key = ?', (key,))
+    
+    def media(self):
+        """Return {name: (media_id, url)} of the uploaded media files, named by their SHA-256 (see MediaStore)."""
+        return {name: (media_id, url) for name, media_id, url in self._query('SELECT name, media_id, url FROM media WHERE site = ?', ())}
+    
+    def recordMedia(self, name, media_id, url):
+        self._record('INSERT OR REPLACE INTO media (site, name, media_id, url) VALUES (?, ?, ?, ?)', (name, media_id, url))
+    
+    def lookups(self, kind):
+        """Return the cached {name: id} map of kind, e.g. 'categories'."""
+        return dict(self._query('SELECT name, id FROM lookups WHERE site = ? AND kind = ?', (kind,)))
+    
+    def recordLookups(self, kind, mapping, replace=False):
+        """Cache {name: id} of kind, dropping all other cached names of kind if replace is set."""
+        
+        with self._lock, self._db:
+            if (replace):
+                self._db.execute('DELETE FROM lookups WHERE site = ? AND kind = ?', (self._site, kind))
+            self._db.executemany(
+                'INSERT OR REPLACE INTO lookups (site, kind, name, id) VALUES (?, ?, ?, ?)',
+                ((self._site, kind, name, id) for name, id in mapping.items())
+            )
+    
+    def stats(self):
+        
+        posts = self._query('SELECT COUNT(*) FROM posts WHERE site = ?', ())[0][0]
+        comments = self._query('SELECT COUNT(*) FROM comments WHERE site = ?', ())[0][0]
+        return '{0:d} posts, {1:d} comments'.format(posts, comments)
+    
+    def close(self):
+        self._db.close()